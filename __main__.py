@@ -3,73 +3,187 @@ import pygame.gfxdraw
 from numpy import pi, sqrt, cos, sin, arctan2 as atan2
 from pygame.locals import *
 
-from engine import BaseWindow, ScalableRect
-from rockets import BaseRocket
-from menus import MainMenu, PlayMenu
+from engine import BaseWindow, ScalableRect, SceneManager
+from config import config
+from profiler import profiler
+from scenes import registerScenes
+from savegame import Autosaver, load
 import drawinglib as dl
 
 pygame.init()
 
 
 class Game(BaseWindow):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, recordPath=None, simulation=None, **kwargs):
+        """
+        recordPath: file to record the rocket's input to for replay.py
+        simulation: "thread" or "process" to step the rocket off the render loop,
+        None to step it in update
+        """
+        if recordPath and simulation:
+            # the worker steps the rocket where InputRecorder cannot see the steps
+            raise ValueError("recording is not supported with a simulation worker")
         super().__init__(*args, **kwargs)
-        self.rocket = BaseRocket(
-            pygame.Rect(400 - 25, 400, 50, 90), (255, 255, 255), (400, 400), 1
+        # scenes are only built when first entered
+        self.scenes = SceneManager(self)
+        registerScenes(self.scenes, recordPath, simulation)
+        self.scenes.switch("loading")
+        self.autosaver = Autosaver(
+            config.get("savePath"), self.collectSave, config.get("autosaveInterval")
         )
-        self.mainMenu = MainMenu(self.screen.get_rect(), self.setGameState)
-        self.playMenu = PlayMenu(self.screen.get_rect(), self.setGameState)
-        self.state = "menu"
+        self.message = None  # text shown over every scene, e.g. a failed save
+        self.messageTime = 0  # milliseconds left to show it for
+        self.messageRect = None  # region the message was last drawn to
+        config.subscribe(self.configChanged)
+        if config.rejected:
+            self.showMessage(f"Ignoring bad settings: {config.describeRejected()}")
 
-    def update(self):
+    @property
+    def state(self):
+        return self.scenes.currentName
+
+    def configChanged(self, config, changed):
+        if config.rejected:
+            self.showMessage(f"Ignoring bad settings: {config.describeRejected()}")
+        # follow window size changes made to config.json while running
+        if {"gameWidth", "gameHeight"} & changed:
+            self.resize(config.get("gameWidth"), config.get("gameHeight"))
+        self.autosaver.path = config.get("savePath")
+        self.autosaver.timer.interval = config.get("autosaveInterval")
+        if self.resolution is not None:
+            self.resolution.minScale = min(1.0, 1 / config.get("gameScale"))
 
-        # using python version of switch case statement
-        match self.state:
-            case "menu":
-                # self.mainMenu.update(self.dt)  # updating menu is not required
-                pass
-            case "play":
-                pass
-            case "help":
-                pass
-            case "options":
-                pass
-            case "credits":
-                pass
-            case "quit":
-                sys.exit()
-            case "launch":
-                self.rocket.update(self.dt)  # update rocket
+    def resize(self, width, height):
+        super().resize(width, height)
+        self.scenes.resize(width, height)
 
+    def update(self):
+        self.scenes.current.update(self.dt)
+        if self.autosaver.timer.interval:
+            self.autosaver.update(self.dt)
+        if self.autosaver.error is not None:
+            # written on the save thread, reported here once
+            error, self.autosaver.error = self.autosaver.error, None
+            self.showMessage(f"Could not save {self.autosaver.path}: {error}")
+        self.messageTime = max(0, self.messageTime - self.dt)
         super().update()  # update parent class stuff
 
     def draw(self):
-        self.screen.fill((0, 0, 0))  # clear screen
-
-        match self.state:
-            case "menu":
-                self.mainMenu.draw(self.screen)  # draw menu
-            case "play":
-                self.playMenu.draw(self.screen)
-                pass
-            case "help":
-                pass
-            case "options":
-                pass
-            case "credits":
-                pass
-            case "quit":
-                sys.exit()
-            case "launch":
-                self.rocket.draw(self.screen)
-                # self.rocket.drawDebug(self.screen)
-
+        scene = self.scenes.current
+        if self.resolution is not None and scene.scalable:
+            # draw offscreen at the render scale, then stretch it over the window
+            target = self.resolution.surface(self.screen)
+            target.fill((0, 0, 0))
+            scene.draw(target)
+            with profiler.scope("upscale"):
+                self.resolution.upscale(target, self.screen)
+            self.markDirty(self.screen.get_rect())
+        else:
+            self.screen.fill((0, 0, 0))  # clear screen
+            self.markDirty(*scene.draw(self.screen))
+        self.markDirty(*scene.drawUi(self.screen))
+        self.drawMessage()
         super().draw()  # draw parent class stuff
 
+    def showMessage(self, text, duration=5000):
+        """
+        Shows text at the top of the window for duration milliseconds.
+        """
+        self.message = text
+        self.messageTime = duration
+
+    def drawMessage(self):
+        self.markDirty(self.messageRect)  # clears it once it stops being drawn
+        self.messageRect = None
+        if not self.messageTime:
+            return
+        image = dl.textCache.render(self.font, self.message, (255, 120, 120))
+        rect = image.get_rect(midtop=(self.width / 2, 10))
+        self.messageRect = self.screen.blit(image, rect)
+        self.markDirty(self.messageRect)
+
+    def isAnimating(self):
+        # static scenes drop to idleFps, animated ones like the starfield menu do not
+        return self.scenes.current.isAnimating()
+
+    def handleEvent(self, event):
+        if event.type == KEYDOWN and event.key == K_F5:
+            self.autosaver.save()  # quicksave
+        elif event.type == KEYDOWN and event.key == K_F9:
+            self.loadGame(self.autosaver.path)  # quickload
+        else:
+            self.scenes.current.handleEvent(event)
+
+    def collectSave(self):
+        """
+        Gathers the state of every loaded scene, arrays are named scene/array.
+        """
+        arrays, meta = {}, {"scene": self.state, "scenes": {}}
+        for name, scene in self.scenes.scenes.items():
+            state = scene.saveState()
+            if state is None:
+                continue
+            sceneArrays, meta["scenes"][name] = state
+            for key, value in sceneArrays.items():
+                arrays[f"{name}/{key}"] = value
+        return arrays, meta
+
+    def loadGame(self, path):
+        self.autosaver.wait()  # the save may still be being written
+        try:
+            arrays, meta = load(path)
+        except (OSError, ValueError) as error:
+            self.showMessage(f"Could not load {path}: {error}")
+            return
+        for name, sceneMeta in meta["scenes"].items():
+            prefix = name + "/"
+            sceneArrays = {
+                key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)
+            }
+            self.scenes.load(name).loadState(sceneArrays, sceneMeta)
+        self.setGameState(meta["scene"])
+
     def setGameState(self, state):
-        self.state = state
+        self.scenes.switch(state)
+        self.markDirty(self.screen.get_rect())  # the whole scene changes
 
 
 if __name__ == "__main__":
-    game = Game(800, 600, drawFps=True)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="record flight input to this file")
+    parser.add_argument(
+        "--simulation",
+        choices=("thread", "process"),
+        help="step the rocket in its own thread or process",
+    )
+    parser.add_argument(
+        "--dynamic-resolution",
+        action="store_true",
+        help="lower the flight view's resolution to hold --target-fps",
+    )
+    parser.add_argument("--target-fps", type=int, default=60)
+    parser.add_argument(
+        "--profile", action="store_true", help="record frame timings for the whole session"
+    )
+    args = parser.parse_args()
+    if args.record and args.simulation:
+        parser.error("--record cannot be used with --simulation")
+
+    game = Game(
+        config.get("gameWidth"),
+        config.get("gameHeight"),
+        drawFps=True,
+        fixedStep=True,
+        tickRate=60,
+        dirtyRects=True,
+        maxFps=144,
+        idleFps=20,
+        recordPath=args.record,
+        simulation=args.simulation,
+        dynamicResolution=args.dynamic_resolution,
+        targetFps=args.target_fps,
+        profile=args.profile,
+    )
     game.run()
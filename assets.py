@@ -0,0 +1,172 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+
+
+class AssetHandle:
+    def __init__(self, future, finish):
+        """
+        An asset that is loading in the background, get() returns it once done.
+        future: concurrent.futures.Future of the raw data
+        finish: turns the raw data into the asset on the main thread, e.g. to
+        convert a surface to the display format
+        """
+        self.future = future
+        self.finish = finish
+        self.value = None
+        self.loaded = False
+
+    @property
+    def ready(self):
+        """
+        Whether get() would return without waiting on the disk.
+        """
+        return self.loaded or self.future.done()
+
+    def get(self):
+        """
+        Returns the asset, waiting for it if still loading. Errors raised while
+        loading are raised here.
+        """
+        if not self.loaded:
+            self.value = self.finish(self.future.result())
+            self.loaded = True
+            self.future = self.finish = None
+        return self.value
+
+
+class SpriteAtlas:
+    def __init__(self, size=1024, padding=1):
+        """
+        One large surface small sprites are packed into in shelves, each sprite
+        is handed out as a subsurface of it.
+        size: width and height of the atlas
+        padding: transparent pixels kept between sprites
+        """
+        self.size = size
+        self.padding = padding
+        self.surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert_alpha()
+        self.x = 0  # left of the next sprite on the current shelf
+        self.y = 0  # top of the current shelf
+        self.shelfHeight = 0  # tallest sprite on the current shelf
+
+    def add(self, image):
+        """
+        Copies image into the atlas.
+        return: pygame.Surface subsurface holding the image, or None if it is full
+        """
+        width, height = image.get_size()
+        if self.x + width > self.size:
+            # start a new shelf under the current one
+            self.x = 0
+            self.y += self.shelfHeight + self.padding
+            self.shelfHeight = 0
+        if self.x + width > self.size or self.y + height > self.size:
+            return None
+
+        area = pygame.Rect(self.x, self.y, width, height)
+        # the atlas is transparent black, taking the max copies the pixels as they are
+        self.surface.blit(image, area, special_flags=pygame.BLEND_RGBA_MAX)
+        self.x += width + self.padding
+        self.shelfHeight = max(self.shelfHeight, height)
+        return self.surface.subsurface(area)
+
+
+class AssetManager:
+    def __init__(self, workers=4, atlasSize=1024, spriteMax=128):
+        """
+        Loads images and fonts on a thread pool and hands out AssetHandles, so
+        files can be read during a loading screen instead of when first drawn.
+        Each file is only loaded once however often it is asked for.
+        workers: loading threads
+        atlasSize: size of the atlases sprites are packed into
+        spriteMax: largest width or height packed into an atlas
+        """
+        self.workers = workers
+        self.atlasSize = atlasSize
+        self.spriteMax = spriteMax
+        self.executor = None  # started on the first load
+        self.handles = {}  # (kind, path, ...) -> AssetHandle
+        self.atlases = []
+
+    def submit(self, key, load, finish):
+        handle = self.handles.get(key)
+        if handle is None:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="assets")
+            handle = self.handles[key] = AssetHandle(self.executor.submit(load), finish)
+        return handle
+
+    def image(self, path, alpha=True):
+        """
+        Returns a handle to the image at path, converted to the display format.
+        alpha: keep per pixel alpha, False for opaque images which blit faster
+        """
+        return self.submit(
+            ("image", path, alpha),
+            lambda: pygame.image.load(path),
+            lambda image: self.convert(image, alpha),
+        )
+
+    def sprite(self, path):
+        """
+        Returns a handle to a small image at path packed into an atlas, larger
+        images are loaded on their own like image().
+        """
+        return self.submit(
+            ("sprite", path),
+            lambda: pygame.image.load(path),
+            lambda image: self.pack(self.convert(image, True)),
+        )
+
+    def font(self, path, size):
+        """
+        Returns a handle to the font at path and size.
+        """
+
+        def load():
+            with open(path, "rb") as f:
+                return f.read()
+
+        # fonts are made on the main thread, the worker only reads the file
+        return self.submit(
+            ("font", path, size), load, lambda data: pygame.font.Font(io.BytesIO(data), size)
+        )
+
+    def convert(self, image, alpha):
+        """
+        Converts image to the display's pixel format once so blits do not have
+        to, only possible once the display is set up.
+        """
+        if pygame.display.get_surface() is None:
+            return image
+        return image.convert_alpha() if alpha else image.convert()
+
+    def pack(self, image):
+        if max(image.get_size()) > self.spriteMax:
+            return image
+        for atlas in self.atlases:
+            sprite = atlas.add(image)
+            if sprite is not None:
+                return sprite
+        self.atlases.append(SpriteAtlas(self.atlasSize))
+        return self.atlases[-1].add(image)
+
+    def progress(self, handles=None):
+        """
+        Returns the fraction of handles that finished loading, all of them by default.
+        """
+        handles = list(self.handles.values()) if handles is None else handles
+        if not handles:
+            return 1.0
+        return sum(handle.ready for handle in handles) / len(handles)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+assets = AssetManager()  # shared asset loader
@@ -0,0 +1,410 @@
+"""
+Headless benchmarks for drawinglib, menus and rocket physics.
+
+Runs with SDL's dummy video driver so no window is opened. Each benchmark is
+run over a range of sizes, e.g. star or rocket count, and reports the median
+time per call. Results can be saved as a JSON baseline and later runs compared
+against it, failing when a benchmark gets slower than the threshold allows.
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.2
+    python benchmark.py --only rocket --rockets 1,1000,10000
+    python benchmark.py --integrators --steps 0.05,0.2,1
+    python benchmark.py --check-polygons --polygon-sizes 10,33,34
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import runpy
+import sys
+import time
+
+import numpy as np
+import pygame
+
+dname = os.path.dirname(os.path.abspath(__file__))
+os.chdir(dname)  # assets are loaded relative to the project
+sys.path.insert(0, dname)
+
+pygame.init()
+screen = pygame.display.set_mode((800, 600))
+
+import drawinglib as dl
+from menus import Button, Colors, ColoredText, MainMenu, StarryBackground
+from rockets import BaseRocket, RocketSwarm
+from integrators import INTEGRATORS
+from orbits import CelestialBody, GravityModel, KeplerOrbit
+from collision import CollisionSystem, boxCorners
+from particles import ParticleSystem
+
+SEED = 1234  # every benchmark reseeds so runs draw the same scene
+
+
+def randomPolygons(count, vertices=4):
+    """
+    Returns count polygons with corners spread around random centers.
+    """
+    centers = np.random.rand(count, 1, 2) * (700, 500) + 50
+    return np.rint(centers + np.random.uniform(-40, 40, (count, vertices, 2)))
+
+
+def benchAaPolygon(count):
+    polygons = randomPolygons(count)
+
+    def run():
+        for points in polygons:
+            dl.aaPolygon(screen, points, (255, 0, 0))
+
+    return run
+
+
+def benchRectRotated(count):
+    rects = [pygame.Rect(x, y, 50, 90) for x, y in np.random.rand(count, 2) * 700]
+    angles = np.random.rand(count) * 360
+
+    def run():
+        for rect, angle in zip(rects, angles):
+            dl.rectRotated(screen, rect, angle, (0, 255, 0))
+
+    return run
+
+
+def benchTRectRotated(count):
+    texture = pygame.Surface((50, 90), pygame.SRCALPHA)
+    texture.fill((255, 255, 255))
+    positions = np.random.rand(count, 2) * 700
+    angles = np.random.rand(count) * 360
+
+    def run():
+        for pos, angle in zip(positions, angles):
+            dl.tRectRotated(screen, texture, angle, pos)
+        angles[:] += 1.3  # keep hitting new angles
+
+    return run
+
+
+def benchStarryBackground(density):
+    stars = StarryBackground(screen.get_rect(), density)
+    return lambda: stars.draw(screen)
+
+
+def benchButton(count):
+    colors = Colors((100, 100, 100), (50, 50, 50), (150, 150, 150))
+    text = ColoredText("Button", 30, Colors((255,) * 3, (255,) * 3, (0,) * 3))
+    buttons = [
+        Button(pygame.Rect(x, y, 200, 80), colors, text, lambda: None)
+        for x, y in np.random.rand(count, 2) * (600, 520)
+    ]
+
+    def run():
+        for button in buttons:
+            button.draw(screen)
+
+    return run
+
+
+def benchMainMenu(_):
+    menu = MainMenu(screen.get_rect(), lambda state: None)
+    return lambda: menu.draw(screen)
+
+
+def benchRocketUpdate(count):
+    swarm = RocketSwarm(count)
+    rockets = [
+        BaseRocket(pygame.Rect(0, 0, 50, 90), (255, 255, 255), pos, swarm=swarm)
+        for pos in np.random.rand(count, 2) * 700
+    ]
+
+    def run():
+        for rocket in rockets:
+            rocket.update(16)
+
+    return run
+
+
+def benchSwarmStep(count):
+    swarm = RocketSwarm(count)
+    for pos in np.random.rand(count, 2) * 700:
+        swarm.add(pos)
+    swarm.thrust[:count] = 100
+    swarm.turn[:count] = np.random.uniform(-20, 20, count)
+    return lambda: swarm.step(16)
+
+
+def benchCollisions(count):
+    # spread over an area that grows with the count so density stays the same
+    side = np.sqrt(count) * 40
+    centers = np.random.rand(count, 2) * side
+    sizes = np.random.uniform(5, 30, (count, 2))
+    rotations = np.random.rand(count) * 360
+    velocities = np.random.uniform(-1, 1, (count, 2))
+    collisions = CollisionSystem(32)
+
+    def run():
+        centers[:] += velocities  # bodies move between ticks
+        collisions.detect(boxCorners(centers, sizes, rotations))
+
+    return run
+
+
+def benchParticles(count):
+    particles = ParticleSystem(count)
+    nozzles = np.random.rand(100, 2) * (800, 600)
+    headings = np.random.rand(100) * 360
+    vels = np.zeros((100, 2))
+    lifetime = 1000  # at 60 FPS a pool of count stays full with count / 60 emitted a frame
+    perNozzle = max(1, count // 6000)
+
+    def run():
+        particles.emitExhaust(nozzles, headings, vels, perNozzle, life=(lifetime, lifetime))
+        particles.update(1000 / 60)
+        particles.draw(screen)
+
+    # fill the pool before timing
+    for _ in range(60):
+        run()
+    return run
+
+
+def benchGameFrame(state):
+    Game = runpy.run_path(os.path.join(dname, "__main__.py"), run_name="benchmark")[
+        "Game"
+    ]
+    game = Game(800, 600, drawFps=True)
+    game.setGameState(state)
+
+    def run():
+        game.events()
+        game.update()
+        game.draw()
+
+    return run
+
+
+# name -> (benchmark, name of the size argument it scales with)
+BENCHMARKS = {
+    "aaPolygon": (benchAaPolygon, "polygons"),
+    "rectRotated": (benchRectRotated, "polygons"),
+    "tRectRotated": (benchTRectRotated, "polygons"),
+    "StarryBackground.draw": (benchStarryBackground, "stars"),
+    "Button.draw": (benchButton, "buttons"),
+    "MainMenu.draw": (benchMainMenu, None),
+    "BaseRocket.update": (benchRocketUpdate, "rockets"),
+    "RocketSwarm.step": (benchSwarmStep, "rockets"),
+    "CollisionSystem.detect": (benchCollisions, "bodies"),
+    "ParticleSystem.frame": (benchParticles, "particles"),
+    "Game.frame": (benchGameFrame, "states"),
+}
+
+
+def timeCall(fn, minTime, rounds):
+    """
+    Returns the median seconds per call of fn over several rounds, each round
+    calling fn enough times to last at least minTime seconds.
+    """
+    fn()  # warm up caches and pools
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime:
+            break
+        calls *= 2
+
+    results = [elapsed / calls]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        results.append((time.perf_counter() - start) / calls)
+    return float(np.median(results))
+
+
+def runBenchmarks(sizes, only=None, minTime=0.05, rounds=5):
+    """
+    Runs every benchmark at every size.
+    sizes: dict mapping a size argument name to the values to run it with
+    return: dict mapping "name[size]" to seconds per call
+    """
+    results = {}
+    for name, (bench, sizeName) in BENCHMARKS.items():
+        if only and not any(part.lower() in name.lower() for part in only):
+            continue
+        for size in sizes.get(sizeName, (None,)):
+            key = name if size is None else f"{name}[{size}]"
+            np.random.seed(SEED)
+            dl.rotationCache.clear()
+            results[key] = timeCall(bench(size), minTime, rounds)
+            print(f"{key:40} {results[key] * 1e6:12.1f} us", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints how each result changed from the baseline.
+    return: list of benchmark names slower than the baseline by more than threshold
+    """
+    regressions = []
+    for key, seconds in results.items():
+        if key not in baseline:
+            continue
+        change = seconds / baseline[key] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:40} {change * 100:+8.1f}%{flag}")
+    return regressions
+
+
+def integratorAccuracy(steps, orbits=10, rockets=100):
+    """
+    Flies rockets around circular orbits with every integrator at each step size
+    and prints the error against the exact orbit next to the cost.
+    steps: step sizes in simulation units, an orbit takes about 63 units
+    """
+    body = CelestialBody("planet", (0, 0), 1000.0, 10)
+    gravity = GravityModel([body])
+    radius = 100.0
+    speed = np.sqrt(body.mu / radius)
+    period = 2 * np.pi * radius / speed
+    exact = KeplerOrbit(body, (radius, 0), (0, speed), 0).stateAt(orbits * period)[0]
+
+    def energy(pos, vel):
+        return 0.5 * np.sum(vel * vel, axis=1) - body.mu / np.linalg.norm(pos, axis=1)
+
+    accel = lambda pos, vel: gravity.acceleration(pos)
+    print(f"{'integrator':20} {'step':>6} {'pos error':>11} {'energy drift':>13} {'us/unit':>9}")
+    for h in steps:
+        count = int(np.ceil(orbits * period / h))
+        for name, Integrator in INTEGRATORS.items():
+            integrator = Integrator()
+            pos = np.tile((radius, 0.0), (rockets, 1))
+            vel = np.tile((0.0, speed), (rockets, 1))
+            startEnergy = energy(pos, vel)[0]
+            start = time.perf_counter()
+            for _ in range(count - 1):
+                integrator.step(pos, vel, accel, h)
+            integrator.step(pos, vel, accel, orbits * period - h * (count - 1))
+            elapsed = time.perf_counter() - start
+            error = np.linalg.norm(pos[0] - exact)
+            drift = abs(energy(pos, vel)[0] / startEnergy - 1)
+            cost = elapsed / (orbits * period) * 1e6
+            print(f"{integrator.name:20} {h:6.3g} {error:11.3g} {drift:13.3g} {cost:9.1f}")
+
+
+def polygonAccuracy(sizes, scale=1.75):
+    """
+    Draws boxes of each size with aaPolygon and with fresh, unpooled scratch
+    surfaces, and prints the largest difference between them. Sizes whose
+    supersampled and final areas round up to the same pool bucket are the
+    ones worth checking.
+    return: whether every size matched
+    """
+    matched = True
+    print(f"{'size':>6} {'max difference':>15}")
+    for size in sizes:
+        points = np.array([(10, 10), (10 + size, 10), (10 + size // 2, 10 + size)])
+        pooled = pygame.Surface((size + 40, size + 40), 0, screen)
+        dl.aaPolygon(pooled, points, (255, 0, 0))
+
+        reference = pygame.Surface(pooled.get_size(), 0, screen)
+        low = points.min(axis=0)
+        w, h = (points.max(axis=0) - low).astype(int) + 1
+        big = pygame.Surface((int(w * scale), int(h * scale)), 0, screen)
+        pygame.draw.polygon(big, (255, 0, 0), ((points - low) * scale).tolist())
+        small = pygame.Surface((w, h), 0, screen)
+        pygame.transform.smoothscale(big, (w, h), small)
+        reference.blit(small, low.tolist())
+
+        difference = np.abs(
+            pygame.surfarray.array3d(pooled).astype(int) - pygame.surfarray.array3d(reference)
+        ).max()
+        matched = matched and difference == 0
+        print(f"{size:6} {difference:15}{'' if difference == 0 else '  MISMATCH'}")
+    return matched
+
+
+def parseSizes(text, cast=int):
+    return [cast(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--only", nargs="*", help="run benchmarks whose name contains one of these")
+    parser.add_argument("--polygons", default="1,10,100", help="polygon and sprite counts")
+    parser.add_argument("--stars", default="1,10,100", help="starfield density multipliers")
+    parser.add_argument("--buttons", default="1,10,100", help="button counts")
+    parser.add_argument("--rockets", default="1,100,1000", help="rocket counts")
+    parser.add_argument("--bodies", default="100,1000,10000", help="collision body counts")
+    parser.add_argument("--particles", default="1000,10000,50000", help="particle pool sizes")
+    parser.add_argument("--states", default="menu,play,launch", help="game states to frame")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds to take the median of")
+    parser.add_argument(
+        "--integrators", action="store_true", help="compare integrator accuracy and cost"
+    )
+    parser.add_argument("--steps", default="0.05,0.2,1", help="integrator step sizes")
+    parser.add_argument(
+        "--check-polygons", action="store_true",
+        help="check pooled aaPolygon against unpooled scratch surfaces",
+    )
+    parser.add_argument("--polygon-sizes", default="10,20,33,34,50,70", help="box sizes to check")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="compare against a JSON baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%"
+    )
+    args = parser.parse_args()
+
+    if args.integrators:
+        integratorAccuracy(parseSizes(args.steps, float))
+        return
+
+    if args.check_polygons:
+        if not polygonAccuracy(parseSizes(args.polygon_sizes)):
+            sys.exit(1)
+        return
+
+    sizes = {
+        "polygons": parseSizes(args.polygons),
+        "stars": parseSizes(args.stars, float),
+        "buttons": parseSizes(args.buttons),
+        "rockets": parseSizes(args.rockets),
+        "bodies": parseSizes(args.bodies),
+        "particles": parseSizes(args.particles),
+        "states": args.states.split(","),
+    }
+    results = runBenchmarks(sizes, args.only, args.min_time, args.rounds)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "pygame": pygame.version.ver,
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import numpy as np
+import pygame
+from profiler import profiler
+
+
+class Camera:
+    def __init__(self, viewSize, pos=(0, 0), zoom=1.0, minZoom=1 / 64, maxZoom=8.0):
+        """
+        Maps world coordinates to the screen, pos is the world point drawn at the
+        middle of the view and zoom the screen pixels per world unit.
+        viewSize: width and height of the view in pixels
+        """
+        self.viewSize = np.array(viewSize, dtype=np.float64)
+        self.pos = np.array(pos, dtype=np.float64)
+        self.prevPos = self.pos.copy()  # before the last update, for interpolation
+        self.center = self.pos.copy()  # world point drawn in the middle this frame
+        self.zoom = zoom
+        self.renderScale = 1.0  # pixels of the surface drawn to per window pixel
+        self.minZoom = minZoom
+        self.maxZoom = maxZoom
+        self.target = None  # callable returning the world point to follow
+        self.stiffness = 10.0  # how quickly follow catches up, per second
+
+    @property
+    def scale(self):
+        # pixels of the surface drawn to per world unit
+        return self.zoom * self.renderScale
+
+    def worldToScreen(self, points):
+        """
+        points: np.ndarray (... x 2) of world positions
+        return: np.ndarray of the same shape in pixels of the surface drawn to
+        """
+        return (np.asarray(points) - self.center) * self.scale + self.viewSize * self.renderScale / 2
+
+    def screenToWorld(self, points):
+        return (np.asarray(points) - self.viewSize * self.renderScale / 2) / self.scale + self.center
+
+    def viewport(self, margin=0):
+        """
+        Returns the world space bounds of the view as (minX, minY, maxX, maxY).
+        margin: extra screen pixels around the view
+        """
+        half = (self.viewSize / 2 + margin) / self.zoom
+        return (*(self.center - half), *(self.center + half))
+
+    def follow(self, target, stiffness=10.0):
+        """
+        target: callable returning the world point to keep in the middle, None to stop
+        """
+        self.target = target
+        self.stiffness = stiffness
+
+    def update(self, dt):
+        """
+        Moves towards the followed target.
+        dt: milliseconds since the last update
+        return: whether the view moved
+        """
+        self.prevPos[:] = self.pos
+        if self.target is None:
+            return False
+        goal = np.asarray(self.target(), dtype=np.float64)
+        # exponential ease so the catch up speed does not depend on the frame rate
+        step = 1 - np.exp(-self.stiffness * dt / 1000)
+        moved = (goal - self.pos) * step
+        self.pos += moved
+        return bool(np.any(np.abs(moved * self.scale) >= 0.01))
+
+    def zoomBy(self, factor, anchor=None):
+        """
+        Zooms by factor, keeping the world point under anchor, a screen position,
+        in place.
+        """
+        before = self.screenToWorld(anchor) if anchor is not None else None
+        self.zoom = float(np.clip(self.zoom * factor, self.minZoom, self.maxZoom))
+        if before is not None:
+            shift = before - self.screenToWorld(anchor)
+            for pos in (self.pos, self.prevPos, self.center):
+                pos += shift
+
+    def interpolate(self, alpha):
+        """
+        Places the view between the last two updates, with the same alpha the
+        followed object is drawn at, so the two move together between updates.
+        """
+        self.center = self.prevPos + (self.pos - self.prevPos) * alpha
+
+    def moveTo(self, pos):
+        # jump without interpolating from the old position
+        self.pos[:] = pos
+        self.prevPos[:] = pos
+        self.center[:] = pos
+
+    def resize(self, viewSize):
+        self.viewSize = np.array(viewSize, dtype=np.float64)
+
+    def renderTo(self, surface):
+        """
+        Matches renderScale to surface, e.g. an offscreen target smaller than the
+        window, so the same part of the world fills it.
+        """
+        self.renderScale = surface.get_width() / self.viewSize[0]
+
+
+class LooseGrid:
+    def __init__(self, cellSize=256):
+        """
+        Finds which of many objects overlap a region. Each object is filed under
+        the cell its center is in and queries grow by the largest object, so an
+        object is filed once however large it is and moving it only touches the
+        objects that changed cell.
+        cellSize: side of a cell in world units, a few times a typical object works best
+        """
+        self.cellSize = cellSize
+        self.mins = np.zeros((0, 2))
+        self.maxs = np.zeros((0, 2))
+        self.keys = np.zeros(0, dtype=np.int64)  # cell of every object
+        self.order = np.zeros(0, dtype=np.intp)  # objects sorted by cell
+        self.sortedKeys = np.zeros(0, dtype=np.int64)
+        self.reach = 0.0  # largest distance from a center to the edge of its object
+
+    def cellKeys(self, mins, maxs):
+        cells = np.floor((mins + maxs) / 2 / self.cellSize).astype(np.int64)
+        # rows of cells are contiguous ranges of keys, so a query is a slice per row
+        return cells[:, 1] * (1 << 32) + cells[:, 0]
+
+    def build(self, mins, maxs):
+        """
+        mins, maxs: np.ndarray (n x 2) world bounds of every object
+        """
+        self.mins = np.array(mins, dtype=np.float64)
+        self.maxs = np.array(maxs, dtype=np.float64)
+        self.keys = self.cellKeys(self.mins, self.maxs)
+        self.reach = float(np.max(self.maxs - self.mins, initial=0)) / 2
+        self.sort()
+
+    def move(self, rows, mins, maxs):
+        """
+        Updates the bounds of some objects, resorting only if one changed cell.
+        """
+        self.mins[rows] = mins
+        self.maxs[rows] = maxs
+        self.reach = max(self.reach, float(np.max(self.maxs[rows] - self.mins[rows], initial=0)) / 2)
+        keys = self.cellKeys(self.mins[rows], self.maxs[rows])
+        if np.any(keys != self.keys[rows]):
+            self.keys[rows] = keys
+            self.sort()
+
+    def sort(self):
+        # stable sort runs fast on the nearly sorted keys left by the last build
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sortedKeys = self.keys[self.order]
+
+    def query(self, bounds):
+        """
+        Returns the indices of objects overlapping bounds, (minX, minY, maxX, maxY).
+        """
+        with profiler.scope("cull"):
+            minX, minY, maxX, maxY = bounds
+            # a center this far outside the bounds can still overlap them
+            low = np.floor((np.array((minX, minY)) - self.reach) / self.cellSize).astype(np.int64)
+            high = np.floor((np.array((maxX, maxY)) + self.reach) / self.cellSize).astype(np.int64)
+            rows = np.arange(low[1], high[1] + 1) * (1 << 32)
+            starts = np.searchsorted(self.sortedKeys, rows + low[0])
+            ends = np.searchsorted(self.sortedKeys, rows + high[0], side="right")
+            if not len(starts) or not (ends - starts).any():
+                return np.zeros(0, dtype=np.intp)
+            found = self.order[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])]
+
+            # exact test, the cells only narrow it down
+            inside = (
+                (self.mins[found, 0] <= maxX) & (self.maxs[found, 0] >= minX)
+                & (self.mins[found, 1] <= maxY) & (self.maxs[found, 1] >= minY)
+            )
+            return found[inside]
+
+
+def drawMarkers(surface, points, color):
+    """
+    Draws each screen point as a single pixel, the level of detail for objects
+    too small to make out.
+    points: np.ndarray (n x 2)
+    """
+    width, height = surface.get_size()
+    xs = points[:, 0].astype(np.intp)
+    ys = points[:, 1].astype(np.intp)
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    pixels = pygame.surfarray.pixels2d(surface)
+    pixels[xs[inside], ys[inside]] = surface.map_rgb(color)
+    del pixels  # unlock the surface
@@ -0,0 +1,190 @@
+import numpy as np
+import drawinglib as dl
+from profiler import profiler
+
+# Bodies are convex polygons given as an (n x k x 2) array of world space
+# vertices, e.g. the corners drawinglib's rectRotated and tRectRotated return,
+# or boxCorners for many rotated rects at once.
+
+
+def boxCorners(centers, sizes, rotations):
+    """
+    Returns the corners of rotated rects, in the same order as drawinglib.
+    centers: np.ndarray (n x 2)
+    sizes: np.ndarray (n x 2) of widths and heights
+    rotations: np.ndarray (n) in degrees
+    return: np.ndarray (n x 4 x 2)
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    offsets = dl.cornerOffsetsArray(sizes[:, 0], sizes[:, 1], rotations)
+    return offsets + np.asarray(centers, dtype=np.float64)[:, None]
+
+
+class SpatialHash:
+    def __init__(self, cellSize=64):
+        """
+        Uniform grid broadphase, finds the pairs of bounding boxes that overlap
+        by only comparing boxes that share a cell.
+        cellSize: side of a cell, around the size of a typical body works best
+        """
+        self.cellSize = cellSize
+        self.cells = None  # cell range of every body the candidates were found from
+        self.candidates = np.zeros((0, 2), dtype=np.int64)
+
+    def pairs(self, mins, maxs):
+        """
+        Returns every pair of overlapping boxes.
+        mins, maxs: np.ndarray (n x 2) corners of the bounding boxes
+        return: np.ndarray (m x 2) of indices, the lower index first
+        """
+        cellMin = np.floor(mins / self.cellSize).astype(np.int64)
+        cellMax = np.floor(maxs / self.cellSize).astype(np.int64)
+        cells = np.concatenate((cellMin, cellMax), axis=1)
+        # bodies mostly stay in the same cells between ticks, so the grid is only
+        # rebuilt when one of them moved into another cell
+        if self.cells is None or not np.array_equal(cells, self.cells):
+            self.candidates = self.shareCell(cellMin, cellMax)
+            self.cells = cells
+
+        a, b = self.candidates[:, 0], self.candidates[:, 1]
+        overlap = np.all((mins[a] <= maxs[b]) & (mins[b] <= maxs[a]), axis=1)
+        return self.candidates[overlap]
+
+    def shareCell(self, cellMin, cellMax):
+        """
+        Returns every pair of bodies covering a common cell.
+        """
+        n = len(cellMin)
+        if n < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        spans = cellMax - cellMin + 1
+        counts = spans[:, 0] * spans[:, 1]
+
+        # one entry per body per cell it covers
+        ids = np.repeat(np.arange(n), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        x = cellMin[ids, 0] + local % spans[ids, 0]
+        y = cellMin[ids, 1] + local // spans[ids, 0]
+        low = cellMin.min(axis=0)
+        keys = (x - low[0]) * (cellMax[:, 1].max() - low[1] + 1) + (y - low[1])
+
+        # sorted by cell then body, bodies in one cell are a run of equal keys and
+        # pairing each entry with the one k places later covers every pair in a run
+        order = np.lexsort((ids, keys))
+        keys, ids = keys[order], ids[order]
+        found = []
+        k = 1
+        while k < len(keys):
+            same = keys[k:] == keys[:-k]
+            if not same.any():
+                break  # no run is longer than k
+            found.append(ids[:-k][same] * n + ids[k:][same])
+            k += 1
+        if not found:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        # bodies sharing several cells are found once per cell
+        found = np.unique(np.concatenate(found))
+        return np.column_stack((found // n, found % n))
+
+
+def edgeNormals(polygons):
+    """
+    Returns the unit normal of every edge.
+    polygons: np.ndarray (n x k x 2)
+    return: np.ndarray (n x k x 2)
+    """
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    normals = np.stack((-edges[..., 1], edges[..., 0]), axis=2)
+    length = np.linalg.norm(normals, axis=2, keepdims=True)
+    return normals / np.where(length > 0, length, 1)
+
+
+def projectionRange(ax, ay, polygons):
+    """
+    Returns the lowest and highest projection of each polygon onto its axes.
+    ax, ay: np.ndarray (m x axes) components of the axes of each polygon
+    """
+    # one vertex at a time, reducing over the short vertex axis is much slower
+    low = high = None
+    for v in range(polygons.shape[1]):
+        proj = ax * polygons[:, v, 0, None] + ay * polygons[:, v, 1, None]
+        if low is None:
+            low, high = proj, proj.copy()
+        else:
+            np.minimum(low, proj, out=low)
+            np.maximum(high, proj, out=high)
+    return low, high
+
+
+def separatingAxis(a, b):
+    """
+    Separating axis test of pairs of convex polygons.
+    a, b: np.ndarray (m x k x 2), the polygons of each pair
+    return: whether each pair intersects, the normal pushing b out of a, and
+    how far b has to move along it
+    """
+    axes = np.concatenate((edgeNormals(a), edgeNormals(b)), axis=1)
+    ax, ay = axes[..., 0], axes[..., 1]
+    lowA, highA = projectionRange(ax, ay, a)
+    lowB, highB = projectionRange(ax, ay, b)
+    overlap = np.minimum(highA, highB) - np.maximum(lowA, lowB)
+
+    # the axis of least overlap is the shortest way out
+    best = overlap.argmin(axis=1)
+    rows = np.arange(len(a))
+    depth = overlap[rows, best]
+    normal = axes[rows, best]
+    # point the normal from a towards b
+    away = np.einsum("md,md->m", normal, b.mean(axis=1) - a.mean(axis=1)) < 0
+    normal[away] *= -1
+    return depth > 0, normal, depth
+
+
+class Contacts:
+    def __init__(self, pairs, normals, depths):
+        """
+        Intersecting pairs found by CollisionSystem.detect.
+        pairs: np.ndarray (m x 2) of body indices
+        normals: np.ndarray (m x 2), unit normal pushing the second body out of the first
+        depths: np.ndarray (m), how far the bodies overlap along the normal
+        """
+        self.pairs = pairs
+        self.normals = normals
+        self.depths = depths
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+class CollisionSystem:
+    def __init__(self, cellSize=64, batchSize=4096):
+        """
+        Finds intersecting bodies with a SpatialHash broadphase and a batched
+        separating axis narrowphase.
+        batchSize: candidate pairs tested per numpy batch, bounds temporary memory
+        """
+        self.broadphase = SpatialHash(cellSize)
+        self.batchSize = batchSize
+
+    def detect(self, polygons):
+        """
+        polygons: np.ndarray (n x k x 2) convex polygons with the same vertex count
+        return: Contacts
+        """
+        with profiler.scope("collisions"):
+            polygons = np.asarray(polygons, dtype=np.float64)
+            vertices = polygons.transpose(1, 0, 2)  # reduce over vertices as the outer axis
+            mins = np.minimum.reduce(vertices)
+            maxs = np.maximum.reduce(vertices)
+            candidates = self.broadphase.pairs(mins, maxs)
+
+            pairs = [np.zeros((0, 2), dtype=np.int64)]
+            normals, depths = [np.zeros((0, 2))], [np.zeros(0)]
+            for start in range(0, len(candidates), self.batchSize):
+                batch = candidates[start : start + self.batchSize]
+                hit, normal, depth = separatingAxis(polygons[batch[:, 0]], polygons[batch[:, 1]])
+                pairs.append(batch[hit])
+                normals.append(normal[hit])
+                depths.append(depth[hit])
+            return Contacts(np.concatenate(pairs), np.concatenate(normals), np.concatenate(depths))
@@ -0,0 +1,116 @@
+import os
+import json
+import warnings
+
+dname = os.path.dirname(os.path.abspath(__file__))
+
+
+class Config:
+    # every known setting with its default, values read from the file are cast
+    # to the type of the default
+    defaults = {
+        "gameScale": 3.0,
+        "gameWidth": 800,
+        "gameHeight": 600,
+        "savePath": "quicksave.rks",
+        "autosaveInterval": 60000,  # milliseconds, 0 to never autosave
+    }
+    # settings that must pass a check, e.g. ones something divides by
+    checks = {
+        "gameScale": lambda value: value > 0,
+        "gameWidth": lambda value: value > 0,
+        "gameHeight": lambda value: value > 0,
+    }
+
+    def __init__(self, path, pollInterval=1000):
+        """
+        Settings loaded once from a JSON file, which is reloaded when its
+        modification time changes.
+        path: path of the JSON file
+        pollInterval: milliseconds between checks of the file
+        """
+        self.path = path
+        self.pollInterval = pollInterval
+        self.sincePoll = 0
+        self.mtime = None
+        self.values = dict(self.defaults)
+        self.rejected = {}  # settings the last reload could not use, key -> value in the file
+        self.subscribers = []
+        self.reload()
+
+    def get(self, key):
+        return self.values[key]
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def subscribe(self, callback):
+        """
+        Calls callback(config, changedKeys) whenever a reload changes values.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def reload(self):
+        """
+        Reads the file and notifies subscribers of changed or rejected values.
+        return: set of keys that changed
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r") as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            return set()  # missing or half written, keep the current values
+        self.mtime = mtime
+        if not isinstance(loaded, dict):
+            return set()
+
+        values = dict(self.defaults)
+        rejected = {}
+        for key, value in loaded.items():
+            default = self.defaults.get(key)
+            try:
+                value = type(default)(value) if default is not None else value
+                if key in self.checks and not self.checks[key](value):
+                    raise ValueError(value)
+            except (ValueError, TypeError):
+                # a typo in one setting keeps its current value, not the whole file
+                rejected[key] = loaded[key]
+                value = self.values.get(key, default)
+            values[key] = value
+
+        changed = {key for key in values if values[key] != self.values.get(key)}
+        self.values = values
+        self.rejected = rejected
+        if rejected:
+            warnings.warn(f"{self.path}: ignoring {self.describeRejected()}")
+        if changed or rejected:
+            for callback in list(self.subscribers):
+                callback(self, changed)
+        return changed
+
+    def describeRejected(self):
+        return ", ".join(f"{key}={value!r}" for key, value in self.rejected.items())
+
+    def poll(self, dt):
+        """
+        Reloads the file if it was modified, checked every pollInterval milliseconds.
+        dt: milliseconds since the last call
+        """
+        self.sincePoll += dt
+        if self.sincePoll < self.pollInterval:
+            return set()
+        self.sincePoll = 0
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return set()
+        if mtime == self.mtime:
+            return set()
+        return self.reload()
+
+
+config = Config(os.path.join(dname, "config.json"))  # shared game settings
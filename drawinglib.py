@@ -1,31 +1,71 @@
 import pygame
 import pygame.gfxdraw
+from collections import OrderedDict
 import numpy as np
 from numpy import pi, sqrt, cos, sin, arctan2 as atan2
+from profiler import profiler
+from assets import assets
+
+class SurfacePool:
+    def __init__(self):
+        """
+        Reusable scratch surfaces, bucketed by size rounded up to a power of two
+        so a handful of surfaces serve polygons of any size.
+        """
+        self.surfaces = {}  # (role, width, height, bitsize, masks) -> pygame.Surface
+
+    def get(self, size, like, role=None):
+        """
+        Returns a cleared scratch area of exactly size with the pixel format of like.
+        role: areas in use at the same time need different roles, otherwise two
+        sizes in the same bucket are views of the same surface
+        """
+        width = max(16, 1 << (int(size[0]) - 1).bit_length())
+        height = max(16, 1 << (int(size[1]) - 1).bit_length())
+        key = (role, width, height, like.get_bitsize(), like.get_masks())
+        scratch = self.surfaces.get(key)
+        if scratch is None:
+            scratch = self.surfaces[key] = pygame.Surface((width, height), 0, like)
+        area = scratch.subsurface((0, 0, size[0], size[1]))
+        area.fill(0)
+        return area
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+surfacePool = SurfacePool()  # shared scratch surfaces used by aaPolygons
+
 
 def aaPolygon(surface, points, color):
     """
     Draw antialiased polygon using supersampling.
     """
-    scale = 1.75
-    # Calculate minimum x and y values.
-    x_coords = tuple(x for x, _ in points)
-    x_min, x_max = min(x_coords), max(x_coords)
-    y_coords = tuple(y for _, y in points)
-    y_min, y_max = min(y_coords), max(y_coords)
-    # Calculate width and height of target area.
-    w = x_max - x_min + 1
-    h = y_max - y_min + 1
-    # Create scaled surface with properties of target surface.
-    s = pygame.Surface((w * scale, h * scale), 0, surface)
-    s_points = [((x - x_min) * scale, (y - y_min) * scale)
-                for x, y in points]
-    pygame.draw.polygon(s, color, s_points)
-    # Scale down surface to target size for supersampling effect.
-    s2 = pygame.transform.smoothscale(s, (w, h))
-    # Paint smooth polygon on target surface.
-    surface.blit(s2, (x_min, y_min))
-    
+    aaPolygons(surface, (points,), (color,))
+
+
+def aaPolygons(surface, polygons, colors, scale=1.75):
+    """
+    Draw many antialiased polygons using supersampling, reusing pooled scratch surfaces.
+    surface: pygame.Surface
+    polygons: sequence of vertex arrays, or one array of shape (polygons, vertices, 2)
+    colors: one color per polygon
+    """
+    with profiler.scope("aaPolygons"):
+        for points, color in zip(polygons, colors):
+            points = np.asarray(points)
+            # Calculate bounds and size of target area.
+            low = points.min(axis=0)
+            w, h = (points.max(axis=0) - low).astype(int) + 1
+            # Draw scaled polygon on a scratch surface with properties of target surface.
+            big = surfacePool.get((int(w * scale), int(h * scale)), surface, "big")
+            pygame.draw.polygon(big, color, ((points - low) * scale).tolist())
+            # Scale down into a second scratch surface for supersampling effect.
+            small = surfacePool.get((w, h), surface, "small")
+            pygame.transform.smoothscale(big, (w, h), small)
+            # Paint smooth polygon on target surface.
+            surface.blit(small, low.tolist())
+
 
 def rectRotated(surface, rect, rotation, color):
     """
@@ -36,63 +76,182 @@ def rectRotated(surface, rect, rotation, color):
     rotation: float (degrees)
     return: np.ndarray (vertices)
     """
-    # calculate the rotation in radians
-    rot_radians = -rotation * pi / 180
+    # points around the center, rounded so that they are on the pixel grid
+    points = np.rint(cornerOffsets(rect.width, rect.height, rotation) + rect.center)
+    points = points.astype(int)
 
-    # calculate the points around the center of the rectangle, taking width and height into account
-    radius = sqrt((rect.width / 2) ** 2 + (rect.height / 2) ** 2)
-    angle = atan2(rect.height / 2, rect.width / 2)
-    angles = [angle, -angle + pi, angle + pi, -angle]
-
-    # create a numpy array of the points, with axes rounded so that the points are on the pixel grid
-    points = np.array([
-        [
-            round(rect.centerx + radius * cos(a + rot_radians)), 
-            round(rect.centery + radius * sin(a + rot_radians))
-        ] for a in angles
-    ])
-    
     # draw the polygon, using the antialiased polygon function
     aaPolygon(surface, points, color)
     # return the vertices of the rectangle
     return points
 
-def tRectRotated(surface, texture, rotation, topleft):
 
-    # calculate the rotation in radians
+class RotationCache:
+    def __init__(self, step=1, byteBudget=32 * 1024 * 1024):
+        """
+        Caches rotated copies of textures so a rotating sprite costs a lookup and a blit.
+        step: angles are rounded to a multiple of step degrees
+        byteBudget: least recently used rotations are dropped past this many bytes
+        """
+        self.step = step
+        self.byteBudget = byteBudget
+        self.bytes = 0
+        self.entries = OrderedDict()  # (texture, angle) -> (image, corner offsets)
+
+    def quantize(self, rotation):
+        return round(rotation / self.step) * self.step % 360
+
+    def get(self, texture, rotation):
+        """
+        Returns the rotated texture and its corner offsets from the center.
+        """
+        key = (texture, self.quantize(rotation))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+
+        image = pygame.transform.rotate(texture, key[1])
+        entry = (image, cornerOffsets(*texture.get_size(), key[1]))
+        self.entries[key] = entry
+        self.bytes += image.get_width() * image.get_height() * image.get_bytesize()
+
+        # evict least recently used rotations until back under budget
+        while self.bytes > self.byteBudget and len(self.entries) > 1:
+            _, (old, _) = self.entries.popitem(last=False)
+            self.bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+        return entry
+
+    def prewarm(self, texture):
+        """
+        Renders every angle of texture ahead of time, call while loading.
+        """
+        angle = 0
+        while angle < 360:
+            self.get(texture, angle)
+            angle += self.step
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+rotationCache = RotationCache()  # shared cache used by tRectRotated
+
+
+class TextCache:
+    def __init__(self, pixelBudget=4 * 1024 * 1024):
+        """
+        Shares fonts by path and size, and caches rendered text so drawing the same
+        label again costs a lookup.
+        pixelBudget: least recently used renders are dropped past this many pixels
+        """
+        self.pixelBudget = pixelBudget
+        self.pixels = 0
+        self.fonts = {}  # (path, size) -> pygame.font.Font
+        self.entries = OrderedDict()  # (font, text, color, antialias) -> pygame.Surface
+
+    def font(self, path, size):
+        """
+        Returns the font at path and size, waiting for it if it was preloaded
+        and still loading, or loading it the first time it is asked for.
+        """
+        key = (path, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = assets.font(path, size).get()
+        return font
+
+    def render(self, font, text, color, antialias=True):
+        """
+        Returns text rendered with font, the surface must not be drawn on.
+        """
+        key = (font, text, tuple(color), antialias)
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+            return image
+
+        image = self.entries[key] = font.render(text, antialias, color)
+        self.pixels += image.get_width() * image.get_height()
+
+        # evict least recently used text until back under budget
+        while self.pixels > self.pixelBudget and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.pixels -= old.get_width() * old.get_height()
+        return image
+
+    def clear(self):
+        self.entries.clear()
+        self.pixels = 0
+
+
+textCache = TextCache()  # shared fonts and rendered text
+
+
+def cornerOffsets(width, height, rotation):
+    """
+    Returns the corners of a width by height rect rotated by rotation degrees,
+    relative to its center.
+    return: np.ndarray (4 x 2)
+    """
     rot_radians = -rotation * pi / 180
-    
-    rect = texture.get_rect(topleft=topleft)
-
-    # calculate the points around the center of the rectangle, taking width and height into account
-    radius = sqrt((rect.width / 2) ** 2 + (rect.height / 2) ** 2)
-    angle = atan2(rect.height / 2, rect.width / 2)
-    angles = [angle, -angle + pi, angle + pi, -angle]
-
-    # create a numpy array of the points, with axes rounded so that the points are on the pixel grid
-    points = np.array([
-        [
-            round(rect.centerx + radius * cos(a + rot_radians)), 
-            round(rect.centery + radius * sin(a + rot_radians))
-        ] for a in angles
-    ])
-
-    rotated_image = pygame.transform.rotate(texture, rotation)
-    new_rect = rotated_image.get_rect(center = texture.get_rect(topleft=topleft).center)
-
-    surface.blit(rotated_image, new_rect)
-    return points
+    radius = sqrt((width / 2) ** 2 + (height / 2) ** 2)
+    angle = atan2(height / 2, width / 2)
+    angles = np.array([angle, -angle + pi, angle + pi, -angle]) + rot_radians
+    return np.column_stack((np.cos(angles), np.sin(angles))) * radius
+
+
+def cornerOffsetsArray(widths, heights, rotations):
+    """
+    cornerOffsets for arrays of rects at once, in the same corner order.
+    return: np.ndarray (n x 4 x 2)
+    """
+    widths, heights = np.asarray(widths) / 2, np.asarray(heights) / 2
+    radius = np.sqrt(widths**2 + heights**2)
+    angle = np.arctan2(heights, widths)
+    angles = np.column_stack((angle, -angle + pi, angle + pi, -angle))
+    angles -= (np.asarray(rotations) * pi / 180)[:, None]
+    return np.stack((np.cos(angles), np.sin(angles)), axis=2) * radius[:, None, None]
+
+
+def tRectRotated(surface, texture, rotation, topleft, cache=None):
+    """
+    Draws a rotated texture, using a RotationCache so the angle is rounded to its step.
+    surface: pygame.Surface
+    texture: pygame.Surface
+    rotation: float (degrees)
+    topleft: position of the unrotated texture
+    cache: RotationCache, defaults to the shared rotationCache
+    return: np.ndarray (vertices)
+    """
+    if cache is None:
+        cache = rotationCache
+    with profiler.scope("tRectRotated"):
+        rotated_image, offsets = cache.get(texture, rotation)
 
+        center = texture.get_rect(topleft=topleft).center
 
-    
+        # the points are rounded so that they are on the pixel grid
+        points = np.rint(offsets + center).astype(int)
+
+        surface.blit(rotated_image, rotated_image.get_rect(center=center))
+    return points
 
 
 if __name__ == "__main__":
+    import sys
+
     # demonsrate the functions in action
     pygame.init()
     screen = pygame.display.set_mode((800, 600))
     clock = pygame.time.Clock()
-    texture = pygame.image.load("resources/stage_1.png").convert_alpha()
+    # the stage texture is not shipped, fall back to a plain rocket sized rect
+    try:
+        texture = assets.image("resources/stage_1.png").get()
+    except (pygame.error, FileNotFoundError):
+        texture = pygame.Surface((50, 90), pygame.SRCALPHA)
+        texture.fill((255, 255, 255))
     rect = pygame.Rect(0, 0, 800, 600)
     angle = 0
     while True:
@@ -1,18 +1,31 @@
 import pygame
 import sys
-import os
-import json
+import time
+from collections import OrderedDict
+from profiler import profiler
+from config import config
 
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
+
+# events that count as user input for the idle frame rate
+INPUT_EVENTS = (
+    pygame.KEYDOWN,
+    pygame.KEYUP,
+    pygame.MOUSEMOTION,
+    pygame.MOUSEBUTTONDOWN,
+    pygame.MOUSEBUTTONUP,
+    pygame.MOUSEWHEEL,
+    pygame.WINDOWFOCUSGAINED,
+)
 
 
 class ScalableRect:
     def __init__(self, x=0, y=0, w=0, h=0):
         self.rect = pygame.Rect(x, y, w, h)
-        # load scale from config.json
-        with open(dname + "\config.json", "r") as f:
-            self.scale = json.load(f)["gameScale"]
+
+    @property
+    def scale(self):
+        # read from the shared config so scale changes apply live
+        return config.get("gameScale")
 
     def get_rect(self):
         return pygame.Rect(
@@ -23,12 +36,141 @@ class ScalableRect:
         )
 
 
+def mergeRects(rects):
+    """
+    Merges overlapping rects into their unions until none of them overlap.
+    rects: list of pygame.Rect
+    return: list of pygame.Rect
+    """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = 0
+        while i < len(merged):
+            if rect.colliderect(merged[i]):
+                rect.union_ip(merged.pop(i))
+                i = 0  # the grown rect may now overlap earlier ones
+            else:
+                i += 1
+        merged.append(rect)
+    return merged
+
+
+class ResolutionScaler:
+    def __init__(self, targetFps=60, minScale=0.5, maxScale=1.0, step=0.1,
+                 headroom=0.7, smoothing=0.1, cooldown=30, smooth=True):
+        """
+        Picks the resolution the world is drawn at from measured frame times,
+        lowering it while frames run over the budget for targetFps and raising it
+        again once they have headroom, so the frame rate holds and the picture
+        softens instead. The world is drawn to an offscreen target at that
+        resolution and stretched to the window.
+        minScale, maxScale: range of the render scale, a fraction of the window size
+        step: change in render scale at a time
+        headroom: fraction of the budget frames must fit in before scaling back up,
+        far enough below the budget that one step up does not overshoot it
+        smoothing: weight of the newest frame in the average frame time
+        cooldown: frames to wait after a change, so the average sees the new scale
+        smooth: filter when upscaling, otherwise stretch pixels
+        """
+        self.targetFps = targetFps
+        self.minScale = minScale
+        self.maxScale = maxScale
+        self.step = step
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.smooth = smooth
+        self.scale = maxScale
+        self.frameTime = None  # average milliseconds of work per frame
+        self.wait = 0  # frames left before the scale may change again
+        self.target = None  # offscreen surface, reused while its size holds
+
+    @property
+    def budget(self):
+        return 1000 / self.targetFps
+
+    def update(self, frameTime):
+        """
+        Adds the time the last frame took, not counting time spent waiting out
+        the frame cap, and adjusts the scale.
+        return: whether the scale changed
+        """
+        if self.frameTime is None:
+            self.frameTime = frameTime
+        else:
+            self.frameTime += (frameTime - self.frameTime) * self.smoothing
+        if self.wait:
+            self.wait -= 1
+            return False
+
+        scale = self.scale
+        if self.frameTime > self.budget:
+            scale = max(self.minScale, round(scale - self.step, 3))
+        elif self.frameTime < self.budget * self.headroom:
+            scale = min(self.maxScale, round(scale + self.step, 3))
+        if scale == self.scale:
+            return False
+        self.scale = scale
+        self.wait = self.cooldown
+        return True
+
+    def surface(self, screen):
+        """
+        Returns the offscreen target for screen at the current scale.
+        """
+        width, height = screen.get_size()
+        size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        if self.target is None or self.target.get_size() != size:
+            self.target = pygame.Surface(size, 0, screen)  # same pixel format, fast blits
+        return self.target
+
+    def upscale(self, target, screen):
+        """
+        Stretches target over the whole of screen.
+        """
+        if target.get_size() == screen.get_size():
+            screen.blit(target, (0, 0))
+        elif self.smooth and screen.get_bitsize() >= 24:
+            pygame.transform.smoothscale(target, screen.get_size(), screen)
+        else:
+            pygame.transform.scale(target, screen.get_size(), screen)
+
+
 class BaseWindow:
-    def __init__(self, width, height, drawFps=False):
+    def __init__(
+        self,
+        width,
+        height,
+        drawFps=False,
+        fixedStep=False,
+        tickRate=60,
+        maxTicks=5,
+        dirtyRects=False,
+        fullUpdateRatio=0.5,
+        profile=False,
+        maxFps=0,
+        idleFps=0,
+        idleAfter=2000,
+        dynamicResolution=False,
+        targetFps=60,
+    ):
         """
         Creates a window with the given width and height, used to display graphics.
         width: width of window
         height: height of window
+        fixedStep: run update at a fixed rate instead of once per frame
+        tickRate: number of fixed updates per second
+        maxTicks: most fixed updates run in one frame, stops the spiral of death
+        dirtyRects: only present the regions marked with markDirty each frame
+        fullUpdateRatio: present the whole screen once dirty area passes this ratio
+        profile: record phase timings from the start, F3 toggles the overlay
+        maxFps: frame rate cap, 0 for no cap
+        idleFps: frame rate cap once idle, 0 to never throttle
+        idleAfter: milliseconds without input or animation before counting as idle
+        dynamicResolution: lower the resolution scenes that allow it are drawn at
+        to hold targetFps, see ResolutionScaler
+        targetFps: frame rate dynamicResolution aims for
         """
         self.width = width
         self.height = height
@@ -45,6 +187,36 @@ class BaseWindow:
         self.fps_text = self.font.render(
             f"FPS: {self.fps:.0f}", True, (255, 255, 255)
         )  # create text
+        self.profile = profile  # keep recording while the overlay is hidden
+        profiler.enabled = profile or profiler.enabled
+
+        # fixed timestep state
+        self.fixedStep = fixedStep
+        self.tickRate = tickRate
+        self.stepSize = 1000 / tickRate  # milliseconds simulated by each update
+        self.maxTicks = maxTicks
+        self.accumulator = 0  # unsimulated time carried over between frames
+        self.alpha = 1  # how far between the last two updates the frame is drawn
+
+        # dirty rectangle state
+        self.dirtyRects = dirtyRects
+        self.fullUpdateRatio = fullUpdateRatio
+        self.dirty = [self.screen.get_rect()]  # regions changed this frame
+
+        # frame rate policy
+        self.maxFps = maxFps
+        self.idleFps = idleFps
+        self.idleAfter = idleAfter
+        self.lastInput = time.perf_counter()  # time of the last input event
+
+        # dynamic resolution, a logical pixel is gameScale window pixels wide, so
+        # drawing at 1 / gameScale of the window still gives each logical pixel one
+        self.frameTime = 0  # milliseconds of work in the last frame
+        self.resolution = None
+        if dynamicResolution:
+            self.resolution = ResolutionScaler(
+                targetFps, minScale=min(1.0, 1 / config.get("gameScale"))
+            )
 
         # enable anti-aliasing using GL_MULTISAMPLEBUFFERS and GL_MULTISAMPLESAMPLES
         pygame.display.gl_set_attribute(pygame.GL_MULTISAMPLEBUFFERS, 1)
@@ -60,26 +232,116 @@ class BaseWindow:
         """
         Runs the game loop.
         """
+        if self.fixedStep:
+            self.runFixed()
+            return
+
         while self.running:
             start_time = pygame.time.get_ticks()  # start time of frame, used for dt
+            workStart = time.perf_counter()
 
-            self.events()  # handle events
-            self.update()  # update game logic
-            self.draw()  # draw to screen
+            with profiler.scope("events"):
+                self.events()  # handle events
+            with profiler.scope("update"):
+                self.update()  # update game logic
+            with profiler.scope("draw"):
+                self.draw()  # draw to screen
+            self.measureFrame(workStart)
 
             self.fps = self.clock.get_fps()  # update fps
-            self.clock.tick()  # update clock
+            self.clock.tick(self.frameCap())  # update clock, waiting out the cap
             self.dt = pygame.time.get_ticks() - start_time  # calculate dt
 
+    def runFixed(self):
+        """
+        Runs the game loop with a fixed timestep, update is called tickRate times
+        per second no matter how fast frames are drawn and draw uses alpha to
+        interpolate between the last two updates.
+        """
+        lastTime = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            self.accumulator += (now - lastTime) * 1000  # frame time in ms
+            lastTime = now
+            workStart = now
+
+            with profiler.scope("events"):
+                self.events()  # handle events
+
+            ticks = 0
+            self.dt = self.stepSize
+            while self.accumulator >= self.stepSize and ticks < self.maxTicks:
+                with profiler.scope("update"):
+                    self.update()  # update game logic by one step
+                self.accumulator -= self.stepSize
+                ticks += 1
+
+            # drop time we could not catch up on instead of falling further behind
+            if ticks == self.maxTicks:
+                self.accumulator = min(self.accumulator, self.stepSize)
+
+            self.alpha = self.accumulator / self.stepSize
+            with profiler.scope("draw"):
+                self.draw()  # draw to screen
+            self.measureFrame(workStart)
+
+            self.fps = self.clock.get_fps()  # update fps
+            self.clock.tick(self.frameCap())  # update clock, waiting out the cap
+
+    def measureFrame(self, start):
+        """
+        Records the time the frame took up to now, before waiting out the cap,
+        and lets the resolution follow it.
+        start: time.perf_counter() at the start of the frame
+        """
+        self.frameTime = (time.perf_counter() - start) * 1000
+        if self.resolution is not None:
+            self.resolution.update(self.frameTime)
+
+    def frameCap(self):
+        """
+        Returns the frame rate to cap this frame at, idleFps when nothing has
+        happened for idleAfter milliseconds, otherwise maxFps.
+        """
+        if self.idleFps and not self.isAnimating():
+            if (time.perf_counter() - self.lastInput) * 1000 >= self.idleAfter:
+                return self.idleFps
+        return self.maxFps
+
+    def isAnimating(self):
+        """
+        Override to return False while the scene only changes on input.
+        """
+        return True
+
     def events(self):
         """
         Handles events.
         """
         for event in pygame.event.get():  # handle events
+            if event.type in INPUT_EVENTS:
+                self.lastInput = time.perf_counter()
             if event.type == pygame.QUIT:
                 self.running = False  # stop game loop
                 pygame.quit()
                 sys.exit()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # toggle the profiler overlay, recording while it is shown
+                profiler.showOverlay = not profiler.showOverlay
+                profiler.enabled = profiler.showOverlay or self.profile
+                self.markDirty(self.screen.get_rect())
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                # export the session so far
+                name = time.strftime("profile-%Y%m%d-%H%M%S")
+                profiler.exportJson(name + ".json")
+                profiler.exportCsv(name + ".csv")
+            self.handleEvent(event)
+
+    def handleEvent(self, event):
+        """
+        Called with every event, override to pass events to the scene.
+        """
+        pass
 
     def update(self):
         """
@@ -87,6 +349,16 @@ class BaseWindow:
         """
         for timer in self.timers:
             self.timers[timer] += self.dt
+        config.poll(self.dt)  # pick up edits to config.json
+
+    def resize(self, width, height):
+        """
+        Changes the size of the window.
+        """
+        self.width = width
+        self.height = height
+        self.screen = pygame.display.set_mode((self.width, self.height))
+        self.markDirty(self.screen.get_rect())
 
     def draw(self):
         """
@@ -96,13 +368,197 @@ class BaseWindow:
         if self.drawFps:
             if self.timers["fpsUpdate"] >= 1000:
                 self.timers["fpsUpdate"] = 0
+                self.markDirty(self.fps_text.get_rect())  # old text
                 self.fps_text = self.font.render(
                     f"FPS: {self.fps:.0f}", True, (255, 255, 255)
                 )  # create text
+                self.markDirty(self.fps_text.get_rect())  # new text
 
             self.screen.blit(self.fps_text, (0, 0))  # draw text
 
-        pygame.display.update()  # update screen
+        if profiler.showOverlay:
+            self.markDirty(
+                profiler.drawOverlay(
+                    self.screen, self.font,
+                    ("events", "update", "draw", "draw/upscale", "draw/present"),
+                )
+            )
+
+        with profiler.scope("present"):
+            self.present()  # update screen
+
+    def markDirty(self, *rects):
+        """
+        Marks regions of the screen that changed this frame, None is ignored.
+        """
+        self.dirty.extend(rect for rect in rects if rect is not None)
+
+    def present(self):
+        """
+        Updates the screen, only the dirty regions when dirtyRects is enabled.
+        """
+        rects = mergeRects(self.dirty) if self.dirtyRects else []
+        self.dirty = []
+        if not self.dirtyRects:
+            pygame.display.update()
+            return
+
+        area = sum(rect.width * rect.height for rect in rects)
+        if area >= self.fullUpdateRatio * self.width * self.height:
+            pygame.display.update()  # cheaper to present everything
+        elif rects:
+            pygame.display.update(rects)
+
+
+class Scene:
+    persistent = False  # never unloaded, for scenes holding state that must survive
+    keepWarm = True  # stay loaded after exiting until the manager needs the room
+    scalable = False  # drawn at the dynamic render resolution, then stretched to the window
+
+    def __init__(self, game):
+        """
+        One screen of the game, built by SceneManager the first time it is entered.
+        game: the BaseWindow running the scene
+        """
+        self.game = game
+
+    def enter(self):
+        pass
+
+    def exit(self):
+        pass
+
+    def unload(self):
+        # release anything that would outlive the scene otherwise
+        pass
+
+    def resize(self, width, height):
+        pass
+
+    def saveState(self):
+        """
+        return: (dict of name -> array or (array, version), JSON metadata) to
+        save, None if the scene has nothing worth saving
+        """
+        return None
+
+    def loadState(self, arrays, meta):
+        pass
+
+    def handleEvent(self, event):
+        pass
+
+    def update(self, dt):
+        pass
+
+    def draw(self, surface):
+        """
+        surface: the screen, or the offscreen target of a scalable scene
+        return: list of changed regions
+        """
+        return []
+
+    def drawUi(self, surface):
+        """
+        Draws over the scene at the window's own resolution, for text that has
+        to stay sharp however low the scene is rendered.
+        return: list of changed regions
+        """
+        return []
+
+    def isAnimating(self):
+        return False
+
+
+class SceneManager:
+    def __init__(self, game, maxWarm=3):
+        """
+        Stack of scenes registered by name, each constructed on first entry.
+        Exited scenes stay loaded for a quick return unless they opt out, the
+        least recently used are unloaded past maxWarm.
+        maxWarm: loaded scenes kept besides the stack and persistent scenes
+        """
+        self.game = game
+        self.maxWarm = maxWarm
+        self.factories = {}  # name -> callable taking the game, returning a Scene
+        self.scenes = OrderedDict()  # name -> loaded Scene, least recently used first
+        self.stack = []  # names of the entered scenes, the current one last
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    @property
+    def current(self):
+        return self.scenes[self.stack[-1]] if self.stack else None
+
+    @property
+    def currentName(self):
+        return self.stack[-1] if self.stack else None
+
+    def load(self, name):
+        """
+        Returns the scene called name, constructing it if it is not loaded.
+        """
+        scene = self.scenes.get(name)
+        if scene is None:
+            if name not in self.factories:
+                raise KeyError(f"no scene registered as {name!r}")
+            scene = self.scenes[name] = self.factories[name](self.game)
+        self.scenes.move_to_end(name)
+        return scene
+
+    def switch(self, name):
+        """
+        Replaces the current scene with name.
+        """
+        self.leave()
+        self.push(name)
+
+    def push(self, name):
+        """
+        Enters name on top of the current scene, which stays loaded underneath.
+        """
+        scene = self.load(name)
+        self.stack.append(name)
+        scene.enter()
+        self.trim()
+
+    def pop(self):
+        """
+        Exits the current scene and returns to the one under it.
+        """
+        self.leave()
+        if self.stack:
+            self.load(self.stack[-1]).enter()
+        self.trim()
+
+    def leave(self):
+        if not self.stack:
+            return
+        name = self.stack.pop()
+        scene = self.scenes[name]
+        scene.exit()
+        if not (scene.keepWarm or scene.persistent or name in self.stack):
+            self.unload(name)
+
+    def unload(self, name):
+        scene = self.scenes.pop(name, None)
+        if scene is not None:
+            scene.unload()
+
+    def trim(self):
+        # unload the least recently used scenes that are neither entered nor persistent
+        warm = [
+            name
+            for name, scene in self.scenes.items()
+            if name not in self.stack and not scene.persistent
+        ]
+        for name in warm[: max(0, len(warm) - self.maxWarm)]:
+            self.unload(name)
+
+    def resize(self, width, height):
+        for scene in self.scenes.values():
+            scene.resize(width, height)
 
 
 class Interval:
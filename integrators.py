@@ -0,0 +1,121 @@
+import numpy as np
+
+# Integrators advance positions and velocities of many rockets at once by a step
+# h in simulation units. accel(pos, vel) returns the acceleration of every row
+# and is treated as constant in time over the step, which holds for gravity and
+# for thrust at a fixed heading. Arrays are updated in place.
+
+
+class SemiImplicitEuler:
+    """
+    Moves by the current velocity then applies the acceleration at the new
+    position. First order but symplectic, so orbits do not gain or lose energy
+    over time. This is how rockets have always been stepped.
+    """
+
+    name = "semi-implicit Euler"
+
+    def step(self, pos, vel, accel, h):
+        pos += vel * h
+        vel += accel(pos, vel) * h
+
+
+class VelocityVerlet:
+    """
+    Second order and symplectic, for two acceleration evaluations per step.
+    Much more accurate than Euler at the same step size.
+    """
+
+    name = "velocity Verlet"
+
+    def step(self, pos, vel, accel, h):
+        a0 = accel(pos, vel)
+        pos += vel * h + a0 * (0.5 * h * h)
+        vel += (a0 + accel(pos, vel)) * (0.5 * h)
+
+
+class DormandPrince:
+    """
+    Adaptive fifth order Runge-Kutta (RK45), each step is split into as many
+    substeps as needed to keep the estimated error under tolerance. The substep
+    size found is kept for the next call.
+    """
+
+    name = "RK45"
+
+    # Butcher tableau, the nodes are not needed as accel does not depend on time
+    a = (
+        (),
+        (1 / 5,),
+        (3 / 40, 9 / 40),
+        (44 / 45, -56 / 15, 32 / 9),
+        (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+        (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+        (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+    )
+    b5 = (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0)
+    b4 = (5179 / 57600, 0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40)
+
+    def __init__(self, rtol=1e-6, atol=1e-6, maxSubsteps=10000):
+        """
+        rtol, atol: relative and absolute error allowed per substep
+        maxSubsteps: substeps allowed per call before accepting the error
+        """
+        self.rtol = rtol
+        self.atol = atol
+        self.maxSubsteps = maxSubsteps
+        self.h = None  # substep size that last met the tolerance
+        self.evaluations = 0  # acceleration evaluations, for measuring cost
+
+    def step(self, pos, vel, accel, h):
+        remaining = h
+        proposed = self.h or h
+        for _ in range(self.maxSubsteps):
+            if remaining <= 0:
+                break
+            sub = min(proposed, remaining)
+            newPos, newVel, error = self.tryStep(pos, vel, accel, sub)
+            if error <= 1 or sub <= 1e-9 * h:
+                pos[:] = newPos
+                vel[:] = newVel
+                remaining -= sub
+            # grow or shrink the substep towards the size that meets tolerance
+            proposed = sub * min(5.0, max(0.2, 0.9 * max(error, 1e-10) ** -0.2))
+        if remaining > 0:
+            # out of substeps, cover the rest in one step and accept its error so
+            # the state stays in step with the caller's clock
+            pos[:], vel[:], _ = self.tryStep(pos, vel, accel, remaining)
+        self.h = proposed
+
+    def tryStep(self, pos, vel, accel, h):
+        """
+        return: position and velocity after h, and the error relative to tolerance
+        """
+        kPos, kVel = [], []
+        for stage in range(7):
+            p, v = pos, vel
+            for weight, dp, dv in zip(self.a[stage], kPos, kVel):
+                if weight:
+                    p = p + dp * (weight * h)
+                    v = v + dv * (weight * h)
+            kPos.append(v)
+            kVel.append(accel(p, v))
+        self.evaluations += 7
+
+        newPos = pos + sum(k * (b * h) for b, k in zip(self.b5, kPos) if b)
+        newVel = vel + sum(k * (b * h) for b, k in zip(self.b5, kVel) if b)
+        errPos = sum(k * ((b5 - b4) * h) for b5, b4, k in zip(self.b5, self.b4, kPos))
+        errVel = sum(k * ((b5 - b4) * h) for b5, b4, k in zip(self.b5, self.b4, kVel))
+        error = max(
+            np.max(np.abs(errPos) / (self.atol + self.rtol * np.abs(newPos)), initial=0),
+            np.max(np.abs(errVel) / (self.atol + self.rtol * np.abs(newVel)), initial=0),
+        )
+        return newPos, newVel, error
+
+
+# integrators by name, e.g. for picking one from the command line
+INTEGRATORS = {
+    "euler": SemiImplicitEuler,
+    "verlet": VelocityVerlet,
+    "rk45": DormandPrince,
+}
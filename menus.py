@@ -1,6 +1,20 @@
 import pygame
 from pygame.locals import *
 import numpy as np
+from profiler import profiler
+from drawinglib import textCache
+from engine import mergeRects
+from assets import assets
+
+FONT = "assets/fonts/Roboto-Regular.ttf"  # font of every menu label
+
+
+def preloadAssets():
+    """
+    Starts loading the fonts the menus use in the background.
+    return: list of AssetHandle
+    """
+    return [assets.font(FONT, size) for size in (75, 30)]
 
 
 class Colors:
@@ -17,17 +31,27 @@ class Colors:
 
 
 class ColoredText:
-    def __init__(self, text, size, colors):
+    def __init__(self, text, size, colors, path=FONT):
         """
-        Used to render text with different colors for each state of the button
+        Used to render text with different colors for each state of the button,
+        the hover and press renders are only made when first used
         text: str
         size: int
         colors: Colors
+        path: font file
         """
-        self.fontRenderer = pygame.font.Font("assets/fonts/Roboto-Regular.ttf", size)
-        self.idle = self.fontRenderer.render(text, True, colors.idle)
-        self.hover = self.fontRenderer.render(text, True, colors.hover)
-        self.press = self.fontRenderer.render(text, True, colors.press)
+        self.text = text
+        self.colors = colors
+        self.fontRenderer = textCache.font(path, size)
+        self.idle = textCache.render(self.fontRenderer, text, colors.idle)
+
+    @property
+    def hover(self):
+        return textCache.render(self.fontRenderer, self.text, self.colors.hover)
+
+    @property
+    def press(self):
+        return textCache.render(self.fontRenderer, self.text, self.colors.press)
 
 
 class MainMenu:
@@ -49,7 +73,7 @@ class MainMenu:
         self.stars = StarryBackground(rect)
 
         # create buttons in the constructor and not in the draw function to avoid recreating them every frame
-        self.buttons = []
+        self.buttons = WidgetGroup()
         self.buttons.append(
             Button(
                 pygame.Rect(0, 60, 200, 80),
@@ -91,17 +115,38 @@ class MainMenu:
             ),
         )
 
-    def draw(self, screen):
 
-        # draw stars
-        self.stars.draw(screen)
+        # the title and buttons only change on input, so they are baked into a layer
+        self.layer = CachedLayer(
+            rect.size,
+            self.drawStatic,
+            [self.mainMenuTextRect] + [button.drawRect for button in self.buttons],
+        )
+
+    def handleEvent(self, event):
+        self.buttons.handleEvent(event)
 
+    def drawStatic(self, surface):
         # draw text
-        screen.blit(self.mainMenuText.idle, self.mainMenuTextRect)
+        surface.blit(self.mainMenuText.idle, self.mainMenuTextRect)
 
         # draw buttons
-        for button in self.buttons:
-            button.draw(screen)
+        return self.buttons.draw(surface)
+
+    def draw(self, screen, dt=None):
+        """
+        dt: milliseconds since the last frame, used to move the stars
+        return: list of changed regions
+        """
+
+        # draw stars
+        dirty = [self.stars.draw(screen, dt)]
+
+        if self.buttons.changed:
+            self.buttons.changed = False
+            self.layer.invalidate()
+        dirty.extend(self.layer.draw(screen))
+        return dirty
 
 
 class PlayMenu:
@@ -116,7 +161,7 @@ class PlayMenu:
 
         # create buttons in the constructor and not in the draw function to avoid recreating them every frame
         # Tracking Station, Contracts Menu, Hire Crew, Vehicle Assembly Building, Tech Tree
-        self.buttons = []
+        self.buttons = WidgetGroup()
         self.buttons.append(
             Button(
                 pygame.Rect(0, 60, 200, 80),
@@ -166,107 +211,210 @@ class PlayMenu:
             )
         )
 
-    def draw(self, screen):
-        screen.blit(self.playMenuText.idle, self.playMenuTextRect)
+
+        # everything in this menu only changes on input
+        self.layer = CachedLayer(
+            rect.size,
+            self.drawStatic,
+            [self.playMenuTextRect] + [button.drawRect for button in self.buttons],
+        )
+
+    def handleEvent(self, event):
+        self.buttons.handleEvent(event)
+
+    def drawStatic(self, surface):
+        surface.blit(self.playMenuText.idle, self.playMenuTextRect)
 
         # draw buttons
-        for button in self.buttons:
-            button.draw(screen)
+        return self.buttons.draw(surface)
+
+    def draw(self, screen):
+        """
+        return: list of changed regions
+        """
+        if self.buttons.changed:
+            self.buttons.changed = False
+            self.layer.invalidate()
+        return self.layer.draw(screen)
+
+
+class CachedLayer:
+    def __init__(self, size, render, areas):
+        """
+        Static content baked into a surface and only redrawn when invalidated.
+        size: size of the layer
+        render: function drawing the content onto a surface, returning changed regions
+        areas: list of pygame.Rect that the content can cover, only these are blitted
+        """
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.render = render
+        self.areas = mergeRects(areas)
+        self.stale = True
+
+    def invalidate(self):
+        self.stale = True
+
+    def draw(self, screen):
+        """
+        return: list of regions that changed since the last draw
+        """
+        dirty = []
+        if self.stale:
+            self.stale = False
+            self.surface.fill((0, 0, 0, 0))
+            dirty = self.render(self.surface)
+        for area in self.areas:
+            screen.blit(self.surface, area, area)
+        return dirty
 
 
 class StarryBackground:
-    def __init__(self, rect):
-        self.starsLayered = [[], [], []]
+    # star count, parallax speed and color of each layer, from back to front
+    layers = (
+        (100, 0.5, (255, 255, 255)),
+        (50, 1.2, (255, 100, 100)),
+        (25, 2, (200, 200, 255)),
+    )
+
+    def __init__(self, rect, density=1):
+        """
+        Parallax starfield, each layer is a numpy array of star positions.
+        rect: pygame.Rect
+        density: multiplier for the number of stars in each layer
+        """
         self.vec = np.array([0, 0], dtype=np.float32)
         self.laggedVec = np.array([0, 0], dtype=np.float32)
 
         # create stars for different layers of the background
-        for i in range(100):
-            self.starsLayered[0].append(
-                [
-                    np.random.randint(0, rect.width),
-                    np.random.randint(0, rect.height),
-                    (255, 255, 255),
-                ],
-            )
+        size = np.array([rect.width, rect.height], dtype=np.float32)
+        self.starsLayered = [
+            np.random.rand(int(count * density), 2).astype(np.float32) * size
+            for count, _, _ in self.layers
+        ]
 
-        for i in range(50):
-            self.starsLayered[1].append(
-                [
-                    np.random.randint(0, rect.width),
-                    np.random.randint(0, rect.height),
-                    (255, 100, 100),
-                ],
+    def draw(self, screen, dt=None):
+        """
+        dt: milliseconds since the last frame, stars move at the same speed at any
+        frame rate when given, otherwise they move a 60 FPS frame's worth
+        return: pygame.Rect, the stars cover the whole screen
+        """
+        with profiler.scope("stars"):
+            width, height = screen.get_size()
+            step = 1 if dt is None else dt * 60 / 1000
+
+            # calculate vec by mouse position
+            mouseX, mouseY = pygame.mouse.get_pos()
+            self.vec = np.array(
+                [mouseX - width / 2, mouseY - height / 2], dtype=np.float32
             )
 
-        for i in range(25):
-            self.starsLayered[2].append(
-                [
-                    np.random.randint(0, rect.width),
-                    np.random.randint(0, rect.height),
-                    (200, 200, 255),
-                ],
-            )
+            # calculate lagged vec by tweening towards vec
+            self.laggedVec += (self.vec - self.laggedVec) * 0.0001
 
-    def draw(self, screen):
+            # normalize and scale
+            norm = np.linalg.norm(self.laggedVec)
+            if norm > 0:
+                self.laggedVec *= 0.5 / norm
+            drawVec = self.laggedVec
 
-        # calculate vec by mouse position
-        self.vec = np.array(
-            [
-                pygame.mouse.get_pos()[0] - screen.get_width() / 2,
-                pygame.mouse.get_pos()[1] - screen.get_height() / 2,
-            ],
-            dtype=np.float32,
-        )
+            # draw every star as a 2x2 block of pixels, written straight into the surface
+            stars = np.concatenate(self.starsLayered).astype(np.intp)
+            xs, ys = stars[:, 0], stars[:, 1]
+            pixels = pygame.surfarray.pixels2d(screen)
+            white = screen.map_rgb((255, 255, 255))
+            for dx in (-1, 0):
+                for dy in (-1, 0):
+                    pixels[np.clip(xs + dx, 0, width - 1), np.clip(ys + dy, 0, height - 1)] = white
+            del pixels  # unlock the surface
+
+            # move stars and wrap them around the screen
+            size = np.array([width, height], dtype=np.float32)
+            for stars, (_, speed, _) in zip(self.starsLayered, self.layers):
+                stars += drawVec * (speed * step)
+                np.mod(stars, size, out=stars)
 
-        # calculate lagged vec by tweening towards vec
-        self.laggedVec += (self.vec - self.laggedVec) * 0.0001
-
-        # normalize and scale
-        drawVec = self.laggedVec
-        drawVec /= np.linalg.norm(self.laggedVec)
-        drawVec *= 0.5
-
-        for star in self.starsLayered[0]:
-            pygame.draw.circle(screen, (255, 255, 255), star[:2], 1)
-            star[0] += drawVec[0] * 0.5
-            star[1] += drawVec[1] * 0.5
-
-            # wrap stars around the screen
-            if star[0] < 0:
-                star[0] = screen.get_width()
-            if star[1] < 0:
-                star[1] = screen.get_height()
-            if star[0] > screen.get_width():
-                star[0] = 0
-            if star[1] > screen.get_height():
-                star[1] = 0
-
-        for star in self.starsLayered[1]:
-            pygame.draw.circle(screen, (255, 255, 255), star[:2], 1)
-            star[0] += drawVec[0] * 1.2
-            star[1] += drawVec[1] * 1.2
-            if star[0] < 0:
-                star[0] = screen.get_width()
-            if star[1] < 0:
-                star[1] = screen.get_height()
-            if star[0] > screen.get_width():
-                star[0] = 0
-            if star[1] > screen.get_height():
-                star[1] = 0
-
-        for star in self.starsLayered[2]:
-            pygame.draw.circle(screen, (255, 255, 255), star[:2], 1)
-            star[0] += drawVec[0] * 2
-            star[1] += drawVec[1] * 2
-            if star[0] < 0:
-                star[0] = screen.get_width()
-            if star[1] < 0:
-                star[1] = screen.get_height()
-            if star[0] > screen.get_width():
-                star[0] = 0
-            if star[1] > screen.get_height():
-                star[1] = 0
+            return screen.get_rect()
+
+
+class WidgetGroup:
+    def __init__(self, cellSize=64):
+        """
+        Holds widgets and routes mouse events to them, finding the widget under
+        the mouse through a grid of cells so only nearby widgets are tested.
+        cellSize: width and height of a grid cell in pixels
+        """
+        self.cellSize = cellSize
+        self.widgets = []
+        self.grid = {}  # (column, row) -> widgets overlapping that cell
+        self.hovered = None
+        self.pressed = None
+        self.changed = True  # a widget may look different since this was cleared
+
+    def __iter__(self):
+        return iter(self.widgets)
+
+    def __len__(self):
+        return len(self.widgets)
+
+    def append(self, widget):
+        self.widgets.append(widget)
+        rect = pygame.Rect(widget.rect)
+        for column in range(rect.left // self.cellSize, (rect.right - 1) // self.cellSize + 1):
+            for row in range(rect.top // self.cellSize, (rect.bottom - 1) // self.cellSize + 1):
+                self.grid.setdefault((column, row), []).append(widget)
+
+    def widgetAt(self, pos):
+        """
+        Returns the last added widget containing pos, or None.
+        """
+        cell = self.grid.get((pos[0] // self.cellSize, pos[1] // self.cellSize), ())
+        for widget in reversed(cell):
+            if widget.rect.collidepoint(pos):
+                return widget
+        return None
+
+    def hover(self, pos):
+        widget = self.widgetAt(pos)
+        if widget is not self.hovered:
+            self.changed = True
+            if self.hovered is not None:
+                self.hovered.setHover(False)
+            if widget is not None:
+                widget.setHover(True)
+            self.hovered = widget
+
+    def reset(self, pos):
+        """
+        Releases any pressed widget and hovers the widget at pos, used when
+        the group is shown again.
+        """
+        if self.pressed is not None:
+            self.pressed.setPressed(False)
+            self.pressed = None
+            self.changed = True
+        self.hover(pos)
+
+    def handleEvent(self, event):
+        if event.type == MOUSEMOTION:
+            self.hover(event.pos)
+        elif event.type == MOUSEBUTTONDOWN and event.button == 1:
+            self.hover(event.pos)
+            if self.hovered is not None:
+                self.pressed = self.hovered
+                self.pressed.setPressed(True)
+                self.changed = True
+                self.pressed.callback()
+        elif event.type == MOUSEBUTTONUP and event.button == 1:
+            if self.pressed is not None:
+                self.pressed.setPressed(False)
+                self.pressed = None
+                self.changed = True
+
+    def draw(self, surface):
+        """
+        return: list of changed regions
+        """
+        return [widget.draw(surface) for widget in self.widgets]
 
 
 class Button:
@@ -278,57 +426,68 @@ class Button:
         callback: function
         """
 
-        self.rect = rect
+        self.rect = pygame.Rect(rect)
         self.text = text
         self.colors = colors
         self.callback = callback
         self.isPressed = False
         self.isHover = False
-        self.debounce = False
-
-    def draw(self, surface):
 
-        # check if button is pressed
-        if pygame.Rect(*self.rect).collidepoint(pygame.mouse.get_pos()):
-            self.isHover = True
-            if pygame.mouse.get_pressed()[0]:
-                self.isPressed = True
-            else:
-                self.isPressed = False
-        else:
-            self.isHover = False
+        # pre-rendered look of each state, made when first drawn
+        self.images = {}
+        self.drawRect = self.rect.inflate(10, 10)  # covers the hover size
+        self.changed = True  # look changed since last draw
 
+    @property
+    def state(self):
         if self.isHover and self.isPressed:
-            pygame.draw.rect(surface, self.colors.press, self.rect)
-            surface.blit(
-                self.text.press,
-                (
-                    self.rect[0] + self.rect[2] / 2 - self.text.idle.get_width() / 2,
-                    self.rect[1] + self.rect[3] / 2 - self.text.idle.get_height() / 2,
-                ),
-            )
-            if not self.debounce:
-                self.callback()
-            self.debounce = True
-        elif self.isHover:
-            pygame.draw.rect(
-                surface, self.colors.hover, pygame.Rect(*self.rect).inflate(10, 10)
-            )
-            surface.blit(
-                self.text.hover,
-                (
-                    self.rect[0] + self.rect[2] / 2 - self.text.idle.get_width() / 2,
-                    self.rect[1] + self.rect[3] / 2 - self.text.idle.get_height() / 2,
-                ),
-            )
-            self.debounce = False
-        else:
-            pygame.draw.rect(surface, self.colors.idle, self.rect)
-            surface.blit(
-                self.text.idle,
-                (
-                    self.rect[0] + self.rect[2] / 2 - self.text.idle.get_width() / 2,
-                    self.rect[1] + self.rect[3] / 2 - self.text.idle.get_height() / 2,
-                ),
-            )
-            self.debounce = False
+            return "press"
+        if self.isHover:
+            return "hover"
+        return "idle"
+
+    def setHover(self, isHover):
+        state = self.state
+        self.isHover = isHover
+        self.changed = self.changed or state != self.state
+
+    def setPressed(self, isPressed):
+        state = self.state
+        self.isPressed = isPressed
+        self.changed = self.changed or state != self.state
+
+    def render(self, state):
+        """
+        Draws the button in a state onto a surface the size of drawRect.
+        """
+        image = pygame.Surface(self.drawRect.size, pygame.SRCALPHA)
+        body = self.rect.move(-self.drawRect.x, -self.drawRect.y)
+        if state == "hover":
+            body = body.inflate(10, 10)
+        pygame.draw.rect(image, getattr(self.colors, state), body)
+
+        # text is centered on the button, which sits 5 pixels into the image
+        image.blit(
+            getattr(self.text, state),
+            (
+                5 + self.rect.width / 2 - self.text.idle.get_width() / 2,
+                5 + self.rect.height / 2 - self.text.idle.get_height() / 2,
+            ),
+        )
+        return image
+
+    def draw(self, surface):
+        """
+        return: pygame.Rect of the button if its look changed since last draw, else None
+        """
+        with profiler.scope("Button.draw"):
+            state = self.state
+            image = self.images.get(state)
+            if image is None:
+                image = self.images[state] = self.render(state)
+            surface.blit(image, self.drawRect)
+
+            if self.changed:
+                self.changed = False
+                return self.drawRect
+            return None
@@ -0,0 +1,259 @@
+import numpy as np
+from numpy import sqrt, sin, cos, sinh, cosh, pi
+
+# Simulation time is measured in the same unit as rocket velocities, one unit
+# being MS_PER_UNIT milliseconds of game time (see rockets.py).
+
+
+class CelestialBody:
+    def __init__(self, name, pos, mu, radius, soi=np.inf):
+        """
+        A body that pulls vessels towards it, fixed in place.
+        pos: position of its center
+        mu: gravitational parameter, G times its mass
+        radius: radius of its surface
+        soi: radius of its sphere of influence, inside it only this body pulls
+        """
+        self.name = name
+        self.pos = np.array(pos, dtype=np.float64)
+        self.mu = mu
+        self.radius = radius
+        self.soi = soi
+
+
+class GravityModel:
+    def __init__(self, bodies):
+        """
+        Patched conic gravity, a vessel is only pulled by the body with the
+        smallest sphere of influence it is inside.
+        bodies: list of CelestialBody
+        """
+        # smallest sphere of influence first, so the first match is the dominant body
+        self.bodies = sorted(bodies, key=lambda body: body.soi)
+
+    def dominant(self, pos):
+        """
+        Returns the body whose sphere of influence pos is in, or None.
+        """
+        for body in self.bodies:
+            offset = pos - body.pos
+            if offset @ offset < body.soi * body.soi:
+                return body
+        return None
+
+    def acceleration(self, positions):
+        """
+        Returns the gravitational acceleration at each position.
+        positions: np.ndarray (n x 2)
+        return: np.ndarray (n x 2)
+        """
+        accel = np.zeros_like(positions)
+        claimed = np.zeros(len(positions), dtype=bool)
+        for body in self.bodies:
+            offset = body.pos - positions
+            distSq = np.einsum("ij,ij->i", offset, offset)
+            inside = ~claimed & (distSq < body.soi * body.soi) & (distSq > 0)
+            dist = np.sqrt(distSq[inside])
+            accel[inside] = offset[inside] * (body.mu / (distSq[inside] * dist))[:, None]
+            claimed |= inside
+        return accel
+
+
+def stumpff(z):
+    """
+    Returns the Stumpff functions C(z) and S(z) used by the universal anomaly.
+    """
+    if z > 1e-6:
+        s = sqrt(z)
+        return (1 - cos(s)) / z, (s - sin(s)) / (s * s * s)
+    if z < -1e-6:
+        s = sqrt(-z)
+        return (cosh(s) - 1) / -z, (sinh(s) - s) / (s * s * s)
+    # series around zero
+    return 1 / 2 - z / 24 + z * z / 720, 1 / 6 - z / 120 + z * z / 5040
+
+
+def stumpffArray(z):
+    """
+    stumpff for an array of z.
+    """
+    C = 1 / 2 - z / 24 + z * z / 720
+    S = 1 / 6 - z / 120 + z * z / 5040
+    pos, neg = z > 1e-6, z < -1e-6
+    s = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(s)) / z[pos]
+    S[pos] = (s - np.sin(s)) / (s * s * s)
+    s = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(s) - 1) / -z[neg]
+    S[neg] = (np.sinh(s) - s) / (s * s * s)
+    return C, S
+
+
+class KeplerOrbit:
+    def __init__(self, body, pos, vel, epoch):
+        """
+        Two body orbit through pos and vel at epoch, any position along it can be
+        found in constant time however far from epoch.
+        body: CelestialBody, or None for motion in a straight line
+        pos, vel: world position and velocity at epoch
+        epoch: simulation time of pos and vel
+        """
+        self.body = body
+        self.epoch = epoch
+        self.r0 = np.array(pos, dtype=np.float64)
+        self.v0 = np.array(vel, dtype=np.float64)
+        if body is None:
+            return
+
+        self.r0 -= body.pos
+        self.rad0 = np.linalg.norm(self.r0)
+        self.vr0 = self.r0 @ self.v0 / self.rad0  # radial velocity
+        self.alpha = 2 / self.rad0 - (self.v0 @ self.v0) / body.mu  # 1 / semi-major axis
+        # bound orbits repeat, so time can be wrapped to a single period
+        self.period = 2 * pi / sqrt(body.mu * self.alpha**3) if self.alpha > 1e-12 else None
+        self.chi = 0.0  # last universal anomaly, a good guess for the next query
+
+    def stateAt(self, time):
+        """
+        Returns the world position and velocity at a simulation time.
+        """
+        dt = time - self.epoch
+        if self.body is None:
+            return self.r0 + self.v0 * dt, self.v0.copy()
+
+        if self.period is not None:
+            dt %= self.period
+        mu, r0, alpha = self.body.mu, self.rad0, self.alpha
+        sqrtMu = sqrt(mu)
+
+        # solve the universal Kepler equation for chi with Newton's method
+        chi = self.chi if self.period is None else sqrtMu * alpha * dt
+        for _ in range(50):
+            z = alpha * chi * chi
+            C, S = stumpff(z)
+            f = (
+                r0 * self.vr0 / sqrtMu * chi * chi * C
+                + (1 - alpha * r0) * chi**3 * S
+                + r0 * chi
+                - sqrtMu * dt
+            )
+            df = (
+                r0 * self.vr0 / sqrtMu * chi * (1 - z * S)
+                + (1 - alpha * r0) * chi * chi * C
+                + r0
+            )
+            step = f / df
+            chi -= step
+            if abs(step) < 1e-10 * max(1.0, abs(chi)):
+                break
+        self.chi = chi
+
+        z = alpha * chi * chi
+        C, S = stumpff(z)
+        # Lagrange coefficients
+        f = 1 - chi * chi / r0 * C
+        g = dt - chi**3 * S / sqrtMu
+        pos = f * self.r0 + g * self.v0
+        r = np.linalg.norm(pos)
+        fDot = sqrtMu / (r * r0) * (z * chi * S - chi)
+        gDot = 1 - chi * chi / r * C
+        vel = fDot * self.r0 + gDot * self.v0
+        return pos + self.body.pos, vel
+
+    def statesAt(self, times):
+        """
+        stateAt for an array of times at once.
+        return: positions and velocities, np.ndarray (n x 2) each, NaN for
+        times the solve did not converge at
+        """
+        dt = np.asarray(times, dtype=np.float64) - self.epoch
+        if self.body is None:
+            return self.r0 + self.v0 * dt[:, None], np.tile(self.v0, (len(dt), 1))
+
+        if self.period is not None:
+            dt = dt % self.period
+        mu, r0, alpha = self.body.mu, self.rad0, self.alpha
+        sqrtMu = sqrt(mu)
+
+        # the elliptic guess, or one scaled by the distance travelled for open orbits
+        if self.period is not None:
+            guess = sqrtMu * alpha * dt
+        else:
+            guess = sqrtMu * dt / r0
+        chi, converged = self.solveChi(dt, guess)
+        chi[~converged] = np.nan  # flagged, the caller decides where the path ends
+
+        z = alpha * chi * chi
+        C, S = stumpffArray(z)
+        f = 1 - chi * chi / r0 * C
+        g = dt - chi**3 * S / sqrtMu
+        pos = f[:, None] * self.r0 + g[:, None] * self.v0
+        r = np.linalg.norm(pos, axis=1)
+        fDot = sqrtMu / (r * r0) * (z * chi * S - chi)
+        gDot = 1 - chi * chi / r * C
+        vel = fDot[:, None] * self.r0 + gDot[:, None] * self.v0
+        return pos + self.body.pos, vel
+
+    def keplerResidual(self, chi, dt):
+        """
+        Returns the universal Kepler equation at chi and its derivative, which
+        is the distance from the body and so always positive.
+        """
+        mu, r0, alpha = self.body.mu, self.rad0, self.alpha
+        sqrtMu = sqrt(mu)
+        z = alpha * chi * chi
+        C, S = stumpffArray(z)
+        f = (
+            r0 * self.vr0 / sqrtMu * chi * chi * C
+            + (1 - alpha * r0) * chi**3 * S
+            + r0 * chi
+            - sqrtMu * dt
+        )
+        df = r0 * self.vr0 / sqrtMu * chi * (1 - z * S) + (1 - alpha * r0) * chi * chi * C + r0
+        return f, df
+
+    def solveChi(self, dt, guess, iterations=100):
+        """
+        Solves the universal Kepler equation for every dt at once. The equation
+        only grows with chi, so the root is bracketed between 0 and a bound
+        doubled from guess until it changes sign, and Newton steps that leave
+        the bracket or converge slowly bisect it instead. Without the bracket a poor guess on a
+        fast open orbit sends Newton's method off to huge values.
+        return: chi and whether each one converged, np.ndarray (n) each
+        """
+        with np.errstate(over="ignore", invalid="ignore"):
+            # f(0) has the opposite sign to dt, find a bound on the same side as dt
+            bound = np.where(guess * dt > 0, guess, dt)
+            for _ in range(iterations):
+                f, _ = self.keplerResidual(bound, dt)
+                short = ((dt > 0) & (f < 0)) | ((dt < 0) & (f > 0))
+                if not short.any():
+                    break
+                bound[short] *= 2
+            lo = np.minimum(bound, 0.0)
+            hi = np.maximum(bound, 0.0)
+            chi = np.clip(guess, lo, hi)
+
+            converged = np.zeros(len(dt), dtype=bool)
+            lastStep = hi - lo
+            for _ in range(iterations):
+                f, df = self.keplerResidual(chi, dt)
+                # overflow past the root gives inf or NaN, which counts as too far
+                over = ~(f <= 0)
+                hi = np.where(over, chi, hi)
+                lo = np.where(f < 0, chi, lo)
+                newton = chi - f / df
+                # Newton's method creeps where the equation grows exponentially,
+                # so it is only used while each step at least halves the last
+                fast = np.abs(newton - chi) <= np.abs(lastStep) / 2
+                inside = (newton > lo) & (newton < hi) & fast
+                new = np.where(inside, newton, (lo + hi) / 2)
+                lastStep = new - chi
+                # a small step, or a residual down to the rounding error of its terms
+                scale = sqrt(self.body.mu) * np.maximum(1.0, np.abs(dt))
+                done = np.abs(f) <= 1e-12 * scale
+                converged = done | (np.abs(new - chi) < 1e-10 * np.maximum(1.0, np.abs(new)))
+                chi = np.where(done, chi, new)
+                if converged.all():
+                    break
+        return chi, converged
@@ -0,0 +1,136 @@
+import numpy as np
+import pygame
+from profiler import profiler
+from rockets import MS_PER_UNIT
+
+
+class ParticleSystem:
+    def __init__(self, capacity=50000, drag=0.0):
+        """
+        Fixed pool of short lived particles stored as arrays, live particles are
+        kept packed at the front so every step is a few numpy operations over
+        count rows. Emitting past capacity drops the new particles.
+        capacity: most particles alive at once
+        drag: fraction of velocity lost per simulation unit
+        """
+        self.capacity = capacity
+        self.drag = drag
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), dtype=np.float32)
+        self.vel = np.zeros((capacity, 2), dtype=np.float32)  # pixels per simulation unit
+        self.life = np.zeros(capacity, dtype=np.float32)  # milliseconds left
+        self.lifetime = np.ones(capacity, dtype=np.float32)  # milliseconds lived in total
+        self.color = np.zeros((capacity, 3), dtype=np.float32)
+        self.drawnRect = None  # region covered when last drawn
+
+    def emit(self, pos, vel, life, color):
+        """
+        Adds particles in bulk, every argument has one row per particle or is
+        shared by all of them.
+        pos, vel: np.ndarray (n x 2)
+        life: milliseconds each particle lives
+        color: (r, g, b) or np.ndarray (n x 3)
+        return: number of particles added
+        """
+        pos = np.asarray(pos, dtype=np.float32).reshape(-1, 2)
+        n = min(len(pos), self.capacity - self.count)
+        if n <= 0:
+            return 0
+        rows = slice(self.count, self.count + n)
+        self.pos[rows] = pos[:n]
+        self.vel[rows] = np.broadcast_to(vel, (len(pos), 2))[:n]
+        self.life[rows] = np.broadcast_to(life, len(pos))[:n]
+        self.lifetime[rows] = self.life[rows]
+        self.color[rows] = np.broadcast_to(color, (len(pos), 3))[:n]
+        self.count += n
+        return n
+
+    def emitExhaust(self, nozzles, headings, vels, perNozzle, speed=60, spread=15,
+                    life=(300, 700), color=(255, 180, 60)):
+        """
+        Emits a cone of exhaust from each nozzle, opposite to its heading.
+        nozzles: np.ndarray (m x 2) positions to emit from
+        headings: np.ndarray (m) rotation of each rocket in degrees
+        vels: np.ndarray (m x 2) velocity of each rocket, inherited by its exhaust
+        perNozzle: particles emitted by each nozzle
+        speed: exhaust speed relative to the rocket, in pixels per simulation unit
+        spread: half angle of the cone in degrees
+        life: range of lifetimes in milliseconds
+        """
+        count = len(nozzles) * perNozzle
+        if count == 0:
+            return 0
+        source = np.repeat(np.arange(len(nozzles)), perNozzle)
+        # the nose points up at 0 degrees, exhaust leaves through the tail
+        theta = np.deg2rad(headings[source] + np.random.uniform(-spread, spread, count))
+        direction = np.column_stack((np.sin(theta), np.cos(theta)))
+        exhaustSpeed = speed * np.random.uniform(0.7, 1.3, count)
+        return self.emit(
+            nozzles[source],
+            vels[source] + direction * exhaustSpeed[:, None],
+            np.random.uniform(*life, count),
+            color,
+        )
+
+    def update(self, dt):
+        """
+        Moves particles by dt milliseconds and retires the ones that ran out of life.
+        """
+        with profiler.scope("particles"):
+            n = self.count
+            scale = dt / MS_PER_UNIT
+            if self.drag:
+                self.vel[:n] *= max(0.0, 1 - self.drag * scale)
+            self.pos[:n] += self.vel[:n] * scale
+            self.life[:n] -= dt
+
+            # swap compaction, live particles from the end fill the holes left by
+            # dead ones so the live ones stay packed at the front
+            dead = self.life[:n] <= 0
+            deaths = np.count_nonzero(dead)
+            if not deaths:
+                return
+            alive = n - deaths
+            holes = np.flatnonzero(dead[:alive])
+            movers = np.flatnonzero(~dead[alive:]) + alive
+            for array in (self.pos, self.vel, self.life, self.lifetime, self.color):
+                array[holes] = array[movers]
+            self.count = alive
+
+    def draw(self, surface, camera=None):
+        """
+        Draws every particle as a pixel, fading out over its lifetime.
+        camera: Camera to draw through, None to draw world positions as they are
+        return: pygame.Rect covering where particles were and now are, or None
+        """
+        with profiler.scope("particles"):
+            n = self.count
+            width, height = surface.get_size()
+            rect = None
+            if n:
+                pos = camera.worldToScreen(self.pos[:n]) if camera else self.pos[:n]
+                xs = pos[:, 0].astype(np.intp)
+                ys = pos[:, 1].astype(np.intp)
+                visible = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+                xs, ys = xs[visible], ys[visible]
+                if len(xs):
+                    fade = (self.life[:n] / self.lifetime[:n])[visible, None]
+                    rgb = (self.color[:n][visible] * fade).astype(np.uint32)
+
+                    # pack into the surface's pixel format, the same as map_rgb per pixel
+                    shifts, losses = surface.get_shifts(), surface.get_losses()
+                    packed = np.uint32(surface.get_masks()[3])  # opaque if it has alpha
+                    for channel in range(3):
+                        packed = packed | (rgb[:, channel] >> losses[channel]) << shifts[channel]
+
+                    pixels = pygame.surfarray.pixels2d(surface)
+                    pixels[xs, ys] = packed
+                    del pixels  # unlock the surface
+                    rect = pygame.Rect(xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1)
+
+            dirty = rect.union(self.drawnRect) if rect and self.drawnRect else rect or self.drawnRect
+            self.drawnRect = rect
+            return dirty
+
+    def clear(self):
+        self.count = 0
@@ -0,0 +1,179 @@
+import pygame
+import time
+import json
+import csv
+from collections import deque
+from itertools import islice
+import numpy as np
+
+
+class NullScope:
+    """
+    Scope returned while the profiler is disabled, does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Scope:
+    def __init__(self, profiler, name):
+        """
+        Times the code inside a with block and records it under the names of
+        every enclosing scope joined by slashes, e.g. "draw/stars".
+        """
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.path = "/".join(self.profiler.stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self.start) * 1000
+        self.profiler.stack.pop()
+        self.profiler.record(self.path, ms)
+        return False
+
+
+class Profiler:
+    # histogram bucket edges in milliseconds
+    buckets = (0, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, float("inf"))
+    # colors used for the first few scopes in the overlay graph
+    graphColors = ((255, 80, 80), (80, 255, 80), (80, 160, 255), (255, 220, 80))
+
+    def __init__(self, enabled=False, maxSamples=100000):
+        """
+        Records how long named scopes take, keeping the most recent samples of
+        each so a long session does not grow without bound.
+        enabled: record timings, when False scope costs one call and an empty with
+        maxSamples: samples kept per scope, older ones are dropped
+        """
+        self.enabled = enabled
+        self.maxSamples = maxSamples
+        self.showOverlay = False
+        self.stack = []  # names of the scopes currently open
+        self.samples = {}  # scope path -> deque of durations in ms
+        self.nullScope = NullScope()
+
+    def scope(self, name):
+        """
+        Returns a context manager timing its block, scopes can be nested.
+        """
+        if not self.enabled:
+            return self.nullScope
+        return Scope(self, name)
+
+    def record(self, name, ms):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.maxSamples)
+        samples.append(ms)
+
+    def reset(self):
+        self.samples = {}
+
+    def percentiles(self, name, last=None):
+        """
+        Returns the p50, p95 and p99 of a scope in ms.
+        last: only use this many of the most recent samples
+        """
+        samples = self.samples.get(name)
+        if not samples:
+            return 0.0, 0.0, 0.0
+        if last is not None:
+            samples = self.recent(name, last)
+        return tuple(np.percentile(samples, (50, 95, 99)).tolist())
+
+    def recent(self, name, count):
+        """
+        Returns the last count samples of a scope as a list.
+        """
+        samples = self.samples.get(name, ())
+        return list(islice(samples, max(0, len(samples) - count), None))
+
+    def report(self):
+        """
+        Returns a summary of every scope, with counts per histogram bucket.
+        return: dict
+        """
+        report = {}
+        for name, samples in self.samples.items():
+            p50, p95, p99 = self.percentiles(name)
+            counts, _ = np.histogram(samples, bins=self.buckets)
+            report[name] = {
+                "count": len(samples),
+                "mean": float(np.mean(samples)),
+                "max": float(np.max(samples)),
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "histogram": counts.tolist(),
+            }
+        return report
+
+    def exportJson(self, path):
+        """
+        Writes the summary and every sample of the session as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "buckets": [str(edge) for edge in self.buckets],
+                    "summary": self.report(),
+                    "samples": {name: list(samples) for name, samples in self.samples.items()},
+                },
+                f,
+            )
+
+    def exportCsv(self, path):
+        """
+        Writes every sample of the session as scope, index, ms rows.
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("scope", "index", "ms"))
+            for name, samples in self.samples.items():
+                for i, ms in enumerate(samples):
+                    writer.writerow((name, i, f"{ms:.4f}"))
+
+    def drawOverlay(self, surface, font, names, history=120):
+        """
+        Draws a graph of the last frames of the given scopes and their percentiles.
+        names: scope paths to show
+        return: pygame.Rect covered by the overlay
+        """
+        lineHeight = font.get_linesize()
+        rect = pygame.Rect(0, 0, 360, 100 + lineHeight * len(names))
+        rect.topright = (surface.get_width(), 0)
+        graph = pygame.Rect(rect.x + 5, rect.y + 5, rect.width - 10, 90)
+
+        panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+        surface.blit(panel, rect)
+        # line at 16.7ms, the budget for 60 FPS, with 33ms at the top of the graph
+        budgetY = graph.bottom - graph.height * 16.7 / 33
+        pygame.draw.line(surface, (90, 90, 90), (graph.x, budgetY), (graph.right, budgetY))
+
+        for i, name in enumerate(names):
+            color = self.graphColors[i % len(self.graphColors)]
+            samples = np.array(self.recent(name, history))
+            if len(samples) > 1:
+                xs = graph.x + np.arange(len(samples)) * graph.width / (history - 1)
+                ys = graph.bottom - np.minimum(samples / 33, 1) * graph.height
+                pygame.draw.lines(surface, color, False, np.column_stack((xs, ys)).tolist())
+
+            p50, p95, p99 = self.percentiles(name, history)
+            text = font.render(
+                f"{name}: {p50:.2f} / {p95:.2f} / {p99:.2f} ms", True, color
+            )
+            surface.blit(text, (rect.x + 5, graph.bottom + 5 + i * lineHeight))
+        return rect
+
+
+profiler = Profiler()  # shared profiler used by the engine, menus and drawinglib
@@ -0,0 +1,167 @@
+"""
+Records the input and dt of every rocket update to a compact binary log and
+replays it without a window, as fast as the CPU allows.
+
+A log is a header holding the rocket's starting state followed by one 9 byte
+record per update: dt in ms as a float64, so replays match exactly, and the
+pressed keys as a bit mask.
+
+    python replay.py flight.rkr
+    python replay.py flight.rkr --compare other.rkr --tolerance 0.01
+"""
+import atexit
+import struct
+import time
+
+import numpy as np
+from pygame.locals import K_a, K_d, K_w
+
+MAGIC = b"RKTR"
+VERSION = 1
+HEADER = struct.Struct("<4sH4d")  # magic, version, x, y, speed, rotation
+RECORD = struct.Struct("<dB")  # dt, key mask
+KEYS = (K_a, K_d, K_w)  # keys stored in the mask, bit 0 first
+
+
+class MaskKeys:
+    def __init__(self, mask):
+        """
+        Stands in for pygame.key.get_pressed() with the keys of a key mask.
+        """
+        self.mask = mask
+
+    def __getitem__(self, key):
+        if key in KEYS:
+            return (self.mask >> KEYS.index(key)) & 1
+        return 0
+
+
+def keyMask(keys):
+    """
+    Packs the recorded keys of a pygame.key.get_pressed() result into a bit mask.
+    """
+    mask = 0
+    for bit, key in enumerate(KEYS):
+        if keys[key]:
+            mask |= 1 << bit
+    return mask
+
+
+class InputRecorder:
+    def __init__(self, path, rocket):
+        """
+        Writes the input of every update of rocket to path, the file is closed
+        when the program exits.
+        rocket: BaseRocket, its current state is stored as the starting state
+        """
+        self.file = open(path, "wb")
+        self.file.write(
+            HEADER.pack(MAGIC, VERSION, *rocket.pos, rocket.speed, rocket.rotation)
+        )
+        atexit.register(self.close)
+
+    def record(self, dt, keys):
+        self.file.write(RECORD.pack(dt, keyMask(keys)))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class Replay:
+    def __init__(self, path):
+        """
+        Reads a log written by InputRecorder.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, x, y, speed, rotation = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        self.startPos = (x, y)
+        self.speed = speed
+        self.rotation = rotation
+
+        records = np.frombuffer(
+            data,
+            dtype=np.dtype([("dt", "<f8"), ("mask", "u1")]),
+            offset=HEADER.size,
+            count=(len(data) - HEADER.size) // RECORD.size,
+        )
+        self.dt = records["dt"]
+        self.masks = records["mask"]
+
+    def __len__(self):
+        return len(self.dt)
+
+    def run(self, rocket=None):
+        """
+        Feeds every recorded update into a rocket.
+        rocket: BaseRocket to drive, a new one at the recorded start when not given
+        return: np.ndarray of shape (updates, 3) with the x, y and rotation after each
+        """
+        if rocket is None:
+            import pygame
+            from rockets import BaseRocket
+
+            rocket = BaseRocket(
+                pygame.Rect(0, 0, 50, 90), (255, 255, 255), self.startPos, self.speed
+            )
+            rocket.rotation = self.rotation
+
+        trajectory = np.empty((len(self), 3))
+        for i, (dt, mask) in enumerate(zip(self.dt.tolist(), self.masks.tolist())):
+            rocket.update(dt, MaskKeys(mask))
+            trajectory[i, :2] = rocket.pos
+            trajectory[i, 2] = rocket.rotation
+        return trajectory
+
+
+def compareTrajectories(a, b, tolerance):
+    """
+    return: (largest position difference, whether it is within tolerance)
+    """
+    if len(a) != len(b):
+        return float("inf"), False
+    error = float(np.max(np.abs(a[:, :2] - b[:, :2]), initial=0))
+    return error, error <= tolerance
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path", help="replay to run")
+    parser.add_argument("--compare", help="replay or saved .npy trajectory to check against")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="allowed position error")
+    parser.add_argument("--save", help="save the trajectory as a .npy fixture")
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    start = time.perf_counter()
+    trajectory = replay.run()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(replay)} updates, {replay.dt.sum() / 1000:.1f}s simulated "
+        f"in {elapsed:.3f}s ({len(replay) / max(elapsed, 1e-9):.0f} updates/s)"
+    )
+    if len(trajectory):
+        x, y, rotation = trajectory[-1]
+        print(f"final position ({x:.3f}, {y:.3f}) rotation {rotation:.3f}")
+
+    if args.save:
+        np.save(args.save, trajectory)
+
+    if args.compare:
+        if args.compare.endswith(".npy"):
+            expected = np.load(args.compare)
+        else:
+            expected = Replay(args.compare).run()
+        error, ok = compareTrajectories(trajectory, expected, args.tolerance)
+        print(f"max position error {error:.3g} {'ok' if ok else 'FAILED'}")
+        if not ok:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,58 +3,316 @@ from pygame.locals import *
 import numpy as np
 from numpy import pi, sqrt, cos, sin, arctan2 as atan2
 import drawinglib as dl
+from orbits import KeplerOrbit
+from integrators import SemiImplicitEuler
+
+MS_PER_UNIT = 500 # milliseconds of game time in one unit of simulation time
+
+class RocketSwarm():
+    # per rocket arrays, one row each
+    fields = ("pos", "vel", "prevPos", "rotation", "prevRotation",
+              "angularVelocity", "speed", "thrust", "turn")
+
+    def __init__(self, capacity=16):
+        """
+        Stores the state of many rockets in contiguous arrays so they can all be
+        stepped with a few numpy operations, each row is one rocket.
+        capacity: number of rows allocated up front, grows when full
+        """
+        self.count = 0
+        self.capacity = 0
+        self.pos = np.zeros((0, 2), dtype=np.float64)
+        self.vel = np.zeros((0, 2), dtype=np.float64)
+        self.prevPos = np.zeros((0, 2), dtype=np.float64)
+        self.rotation = np.zeros(0, dtype=np.float64) # degrees
+        self.prevRotation = np.zeros(0, dtype=np.float64)
+        self.angularVelocity = np.zeros(0, dtype=np.float64) # degrees
+        self.speed = np.zeros(0, dtype=np.float64)
+        self.thrust = np.zeros(0, dtype=np.float64) # thrust input in percent
+        self.turn = np.zeros(0, dtype=np.float64) # rotation input in degrees
+        self.gravity = None # GravityModel pulling every rocket, if any
+        self.integrator = SemiImplicitEuler() # default for stepping rows
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """
+        Reallocates every array with room for capacity rows, keeping existing rows.
+        """
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def state(self):
+        """
+        Returns the rocket arrays for saving, see restore.
+        """
+        return {name: getattr(self, name)[:self.count] for name in self.fields}
+
+    def restore(self, arrays):
+        """
+        Replaces every rocket with the arrays state returned, rows keep their index.
+        """
+        count = len(arrays["pos"])
+        self.count = 0
+        self.grow(max(16, count))
+        for name in self.fields:
+            getattr(self, name)[:count] = arrays[name]
+        self.count = count
+
+    def add(self, startPos, speed=1):
+        """
+        Adds a rocket at startPos and returns its row index.
+        """
+        if self.count == self.capacity:
+            self.grow(max(16, self.capacity * 2))
+        index = self.count
+        self.pos[index] = startPos
+        self.prevPos[index] = startPos
+        self.speed[index] = speed
+        self.count += 1
+        return index
+
+    def step(self, dt, rows=None, integrator=None):
+        """
+        Moves rockets by dt milliseconds under gravity and their thrust and turn inputs.
+        rows: slice of rows to step, defaults to every rocket
+        integrator: integrator to use, defaults to the swarm's
+        """
+        if rows is None:
+            rows = slice(0, self.count)
+        if integrator is None:
+            integrator = self.integrator
+        scale = dt / MS_PER_UNIT
+
+        # remember the previous state for interpolation
+        self.prevPos[rows] = self.pos[rows]
+
+        # turn first, thrust is along the new heading for the whole step
+        self.stepRotation(rows, scale)
+        integrator.step(self.pos[rows], self.vel[rows], self.acceleration(rows), scale)
+
+    def acceleration(self, rows):
+        """
+        Returns a function giving the acceleration of rows from gravity and thrust.
+        """
+        # the nose points up at 0 degrees and turns anticlockwise
+        theta = np.deg2rad(self.rotation[rows])
+        thrust = np.column_stack((-np.sin(theta), -np.cos(theta)))
+        thrust *= (self.speed[rows] * self.thrust[rows])[:, None]
+        gravity = self.gravity
+
+        def accel(pos, vel):
+            if gravity is None:
+                return thrust
+            return thrust + gravity.acceleration(pos)
+
+        return accel
+
+    def stepRotation(self, rows, scale):
+        """
+        Turns rockets by their angular velocity and applies their turn input.
+        """
+        rotation = self.rotation[rows]
+        self.prevRotation[rows] = rotation
+        rotation += self.angularVelocity[rows] * scale
+
+        # wrap both rotations together so interpolating never spins the long way
+        wrap = rotation // 360 * 360
+        rotation -= wrap
+        self.prevRotation[rows] -= wrap
+
+        self.angularVelocity[rows] += self.turn[rows] * scale
+
+    def applyThrust(self, rows, percentage, dt):
+        """
+        Accelerates rockets in the direction they are facing.
+        percentage: thrust in percent, a number or an array with one value per row
+        """
+        # the nose points up at 0 degrees and turns anticlockwise
+        theta = np.deg2rad(self.rotation[rows])
+        accel = self.speed[rows] * percentage * (dt / MS_PER_UNIT)
+        self.vel[rows, 0] -= np.sin(theta) * accel
+        self.vel[rows, 1] -= np.cos(theta) * accel
+
 
 class BaseRocket():
-    def __init__(self, rect, color, startPos, speed = 1):
+    def __init__(self, rect, color, startPos, speed = 1, swarm = None):
+        """
+        A rocket whose state is a row of a RocketSwarm.
+        swarm: RocketSwarm to store the rocket in, a new one is made if not given
+        """
         self.rect = rect
         self.color = color
-        
-        # to store movement
-        self.speed = speed
-        self.rotation = 0 # degrees
-        self.pos = np.array(startPos, dtype=np.float64)
-        
-        # to store momentum
-        self.vel = np.array([0, 0], dtype=np.float64) # velocity
-        self.angularVelocity = 0 # angular momentum in degrees
+
+        # to store movement and momentum
+        self.swarm = swarm if swarm is not None else RocketSwarm(1)
+        self.index = self.swarm.add(startPos, speed)
+
+        # unpowered flight follows an orbit instead of being integrated
+        self.orbit = None # KeplerOrbit while coasting
+        self.time = 0.0 # simulation time, in units of MS_PER_UNIT
+
+        # integrator for each flight phase, None follows the orbit analytically
+        self.integrators = {"powered": None, "coast": None}
         
         self.dt = 0 # time since last update
         self.texture = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
         self.texture.fill(self.color)
+        if pygame.display.get_surface() is not None:
+            self.texture = self.texture.convert_alpha() # match the display so blits skip conversion
+        self.drawnRect = None # region covered when last drawn
+        self.vertices = None # world corners when last drawn, for collision.CollisionSystem
+        self.scaled = None # (zoom, texture) last drawn through a camera
+
+    # views into this rocket's row of the swarm
+    @property
+    def pos(self):
+        return self.swarm.pos[self.index]
+
+    @pos.setter
+    def pos(self, value):
+        self.swarm.pos[self.index] = value
+
+    @property
+    def vel(self):
+        return self.swarm.vel[self.index]
+
+    @vel.setter
+    def vel(self, value):
+        self.swarm.vel[self.index] = value
+
+    @property
+    def prevPos(self):
+        return self.swarm.prevPos[self.index]
+
+    @property
+    def rotation(self):
+        return self.swarm.rotation[self.index]
+
+    @rotation.setter
+    def rotation(self, value):
+        self.swarm.rotation[self.index] = value
+
+    @property
+    def prevRotation(self):
+        return self.swarm.prevRotation[self.index]
+
+    @property
+    def angularVelocity(self):
+        return self.swarm.angularVelocity[self.index]
+
+    @angularVelocity.setter
+    def angularVelocity(self, value):
+        self.swarm.angularVelocity[self.index] = value
+
+    @property
+    def speed(self):
+        return self.swarm.speed[self.index]
+
+    @speed.setter
+    def speed(self, value):
+        self.swarm.speed[self.index] = value
         
-    def update(self, dt):
+    def update(self, dt, keys=None):
+        """
+        keys: pressed keys to steer with, read from the keyboard when not given
+        """
         self.dt = dt # update dt
-        keys = pygame.key.get_pressed() # get pressed keys
-        
-        # update position
-        self.pos += self.vel * self.dt / 500
-        self.rotation += self.angularVelocity * self.dt / 500 # update rotation
-
-        # use a dictionary to map keys to functions
-        keymap = {
-            K_a: lambda: self.rotate(20),
-            K_d: lambda: self.rotate(-20),
-            K_w: lambda: self.applyThrust(),
-        }
-
-        # check if key is pressed and call function
-        for key in keymap:
-            if keys[key]:
-                keymap[key]()
+        self.readInput(keys)
+        phase = self.flightPhase()
+        integrator = self.integrators.get(phase)
+        if phase == "coast" and integrator is None:
+            self.coast(dt)
+        else:
+            self.orbit = None # thrust changes the orbit
+            self.swarm.step(dt, slice(self.index, self.index + 1), integrator)
+            self.time += dt / MS_PER_UNIT
+
+    def flightPhase(self):
+        """
+        Returns the name of the current flight phase, used to pick an integrator.
+        """
+        return "powered" if self.swarm.thrust[self.index] else "coast"
+
+    def coast(self, dt):
+        """
+        Moves the rocket along its orbit around the dominant body, which costs
+        the same however large dt is, so it can be used for time warp.
+        """
+        gravity = self.swarm.gravity
+        body = gravity.dominant(self.pos) if gravity is not None else None
+        if self.orbit is None or self.orbit.body is not body:
+            self.orbit = KeplerOrbit(body, self.pos, self.vel, self.time)
+
+        self.time += dt / MS_PER_UNIT
+        self.prevPos[:] = self.pos
+        self.pos, self.vel = self.orbit.stateAt(self.time)
+        self.swarm.stepRotation(slice(self.index, self.index + 1), dt / MS_PER_UNIT)
+
+        # leaving the sphere of influence starts a new orbit on the next update
+        if gravity is not None and gravity.dominant(self.pos) is not body:
+            self.orbit = None
+
+    def readInput(self, keys=None):
+        """
+        Sets this rocket's thrust and turn inputs from the keyboard.
+        keys: anything indexed by key like pygame.key.get_pressed(), e.g. a replay
+        """
+        if keys is None:
+            keys = pygame.key.get_pressed() # get pressed keys
+        self.swarm.turn[self.index] = 20 * keys[K_a] - 20 * keys[K_d]
+        self.swarm.thrust[self.index] = 100 * keys[K_w]
 
     def applyThrust(self, percentage=100):
-        # caluclate direction vector
-        theta = np.deg2rad(-self.rotation + 90)
-        direction = np.dot(np.array([[cos(theta), -sin(theta)], [sin(theta), cos(theta)]]), np.array([-1, 0]))
-        # move the rocket in the correct direction
-        self.vel += direction * self.speed * percentage * (self.dt / 500)
+        # move the rocket in the direction it is facing
+        self.swarm.applyThrust(slice(self.index, self.index + 1), percentage, self.dt)
         
     def rotate(self, angle):
-        self.angularVelocity += angle * self.dt / 500 # rotate rocket
+        self.angularVelocity += angle * self.dt / MS_PER_UNIT # rotate rocket
     
-    def draw(self, surface):
-        self.rotation %= 360
-        dl.tRectRotated(surface, self.texture, self.rotation, self.pos)
+    def draw(self, surface, alpha=1, camera=None, lodPixels=6):
+        """
+        alpha: how far between the previous and current update to draw, 0 to 1
+        camera: Camera to draw through, None to draw at the world position as is
+        lodPixels: below this many pixels long the rocket is drawn as a dot
+        return: pygame.Rect covering where the rocket was and now is
+        """
+        pos = self.prevPos + (self.pos - self.prevPos) * alpha
+        rotation = self.prevRotation + (self.rotation - self.prevRotation) * alpha
+        if camera is None:
+            points = dl.tRectRotated(surface, self.texture, rotation % 360, pos)
+            self.vertices = points
+        else:
+            center = camera.worldToScreen(pos + np.array(self.rect.size) / 2)
+            if max(self.rect.size) * camera.scale < lodPixels:
+                points = np.array([center - 2, center + 2])
+                pygame.draw.circle(surface, self.color, center, 2)
+            else:
+                texture = self.scaledTexture(camera.scale)
+                topleft = center - np.array(texture.get_size()) / 2
+                points = dl.tRectRotated(surface, texture, rotation % 360, topleft)
+            self.vertices = camera.screenToWorld(points)
+
+        # bounding box of the corners, grown to cover rounding
+        low = points.min(axis=0)
+        rect = pygame.Rect(*low, *(points.max(axis=0) - low + 1)).inflate(4, 4)
+        dirty = rect.union(self.drawnRect) if self.drawnRect else rect
+        self.drawnRect = rect
+        return dirty
+
+    def scaledTexture(self, zoom):
+        """
+        Returns the texture scaled by zoom, kept until the zoom changes.
+        """
+        if zoom == 1:
+            return self.texture
+        if self.scaled is None or self.scaled[0] != zoom:
+            size = np.maximum(1, np.rint(np.array(self.texture.get_size()) * zoom)).astype(int)
+            self.scaled = (zoom, pygame.transform.smoothscale(self.texture, size))
+        return self.scaled[1]
 
         
     def drawDebug(self, surface):
@@ -0,0 +1,143 @@
+"""
+Binary save files for large numeric state.
+
+A save is a fixed header, a small JSON block of metadata describing every array,
+then the arrays themselves as raw contiguous bytes, each aligned so it can be
+memory mapped straight from the file. Loading maps the arrays instead of reading
+them, so only the pages that are used are ever read from disk.
+
+Autosaver takes a snapshot of the state on the main thread, copying only arrays
+that changed since the last snapshot, and writes it out on a background thread.
+"""
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from engine import Interval
+
+MAGIC = b"RKSV"
+VERSION = 1
+HEADER = struct.Struct("<4sHQ")  # magic, version, metadata length
+ALIGN = 64  # byte alignment of every array in the file
+
+
+def save(path, arrays, meta=None):
+    """
+    Writes arrays and meta to path, replacing it only once fully written so a
+    crash mid save leaves the previous save intact.
+    arrays: dict of name -> np.ndarray
+    meta: anything JSON can store, e.g. the scene and simulation time
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": array.shape, "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    start = -(-(HEADER.size + len(header)) // ALIGN) * ALIGN  # arrays start aligned too
+
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).data)
+        f.truncate(start + offset)
+    os.replace(temp, path)
+
+
+def load(path, mmap=True):
+    """
+    Reads a save written by save().
+    mmap: map the arrays from the file read only instead of reading them into memory
+    return: (dict of name -> np.ndarray, meta)
+    """
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a save")
+        magic, version, length = HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} save")
+        header = json.loads(f.read(length))
+        start = -(-(HEADER.size + length) // ALIGN) * ALIGN
+
+        size = os.fstat(f.fileno()).st_size
+        arrays = {}
+        for name, info in header["arrays"].items():
+            dtype, shape = np.dtype(info["dtype"]), tuple(info["shape"])
+            if start + info["offset"] + dtype.itemsize * int(np.prod(shape)) > size:
+                raise ValueError(f"{path} is cut short in {name}")
+            if mmap and np.prod(shape) > 0:
+                arrays[name] = np.memmap(
+                    path, dtype, "r", start + info["offset"], shape
+                )
+            else:
+                f.seek(start + info["offset"])
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(f, dtype, count).reshape(shape)
+    return arrays, header["meta"]
+
+
+class Autosaver:
+    def __init__(self, path, collect, interval=60000):
+        """
+        Saves the state collect returns every interval milliseconds without
+        blocking the frame on the disk.
+        collect: callable returning (dict of name -> array or (array, version), meta),
+        an array given with the same version as last time is not copied again
+        """
+        self.path = path
+        self.collect = collect
+        self.timer = Interval(interval)
+        self.snapshot = {}  # name -> (version, copy) of the last snapshot
+        self.writer = None  # thread writing the last snapshot
+        self.error = None  # exception raised by the last write, if any
+
+    def update(self, dt):
+        self.timer.update(dt)
+        if self.timer.check():
+            self.save()
+
+    @property
+    def saving(self):
+        return self.writer is not None and self.writer.is_alive()
+
+    def save(self):
+        """
+        Snapshots the state and starts writing it.
+        return: False if the previous save is still being written
+        """
+        if self.saving:
+            return False
+        arrays, meta = self.collect()
+        snapshot = {}
+        for name, value in arrays.items():
+            array, version = value if isinstance(value, tuple) else (value, None)
+            last = self.snapshot.get(name)
+            if version is not None and last is not None and last[0] == version:
+                snapshot[name] = last  # unchanged, the old copy is still right
+            else:
+                snapshot[name] = (version, np.array(array))
+        self.snapshot = snapshot
+
+        copies = {name: copy for name, (_, copy) in snapshot.items()}
+        self.writer = threading.Thread(target=self.write, args=(copies, meta), daemon=True)
+        self.writer.start()
+        return True
+
+    def write(self, arrays, meta):
+        try:
+            save(self.path, arrays, meta)
+            self.error = None
+        except Exception as error:
+            # nothing on this thread can report it, the game reads it instead
+            self.error = error
+
+    def wait(self):
+        if self.writer is not None:
+            self.writer.join()
@@ -0,0 +1,416 @@
+import sys
+import atexit
+import pygame
+import numpy as np
+from pygame.locals import *
+
+from engine import Scene
+from assets import assets
+from menus import MainMenu, PlayMenu, FONT, preloadAssets
+from rockets import BaseRocket
+from replay import InputRecorder
+from simulation import SimulationWorker
+from trajectory import TrajectoryPredictor
+from particles import ParticleSystem
+from vessel import Vessel, PARTS, PART_NAMES
+from camera import Camera, LooseGrid, drawMarkers
+from collision import boxCorners
+from drawinglib import textCache, rotationCache
+
+
+class LoadingScene(Scene):
+    keepWarm = False  # only ever shown once
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.handles = preloadAssets()  # assets to wait for
+
+    def update(self, dt):
+        if assets.progress(self.handles) == 1:
+            self.game.setGameState("menu")
+
+    def draw(self, surface):
+        # progress bar in the middle of the screen
+        bar = pygame.Rect(0, 0, surface.get_width() // 2, 20)
+        bar.center = surface.get_rect().center
+        pygame.draw.rect(surface, (255, 255, 255), bar, 1)
+        done = bar.inflate(-4, -4)
+        done.width = int(done.width * assets.progress(self.handles))
+        surface.fill((255, 255, 255), done)
+        return [bar]
+
+    def isAnimating(self):
+        return True
+
+
+class MenuScene(Scene):
+    menuClass = None  # MainMenu or PlayMenu
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.menu = self.menuClass(game.screen.get_rect(), game.setGameState)
+
+    def enter(self):
+        # the mouse may already be over a button of the menu
+        self.menu.buttons.reset(pygame.mouse.get_pos())
+
+    def resize(self, width, height):
+        # menus lay themselves out from the screen size so they are rebuilt
+        self.menu = self.menuClass(self.game.screen.get_rect(), self.game.setGameState)
+
+    def handleEvent(self, event):
+        self.menu.handleEvent(event)
+
+
+class MainMenuScene(MenuScene):
+    menuClass = MainMenu
+
+    def draw(self, surface):
+        return self.menu.draw(surface, self.game.clock.get_time())
+
+    def isAnimating(self):
+        # the starfield moves every frame, so the menu never counts as idle
+        return True
+
+
+class PlayMenuScene(MenuScene):
+    menuClass = PlayMenu
+
+    def draw(self, surface):
+        return self.menu.draw(surface)
+
+
+class PlaceholderScene(Scene):
+    keepWarm = False  # costs one render to rebuild
+
+    def __init__(self, game, title, back):
+        """
+        Stands in for a screen that is not built yet, escape or a click goes back.
+        back: name of the scene to return to
+        """
+        super().__init__(game)
+        self.back = back
+        font = textCache.font(FONT, 30)
+        self.title = textCache.render(font, title, (255, 255, 255))
+        self.hint = textCache.render(font, "Not built yet, press escape", (150, 150, 150))
+
+    def handleEvent(self, event):
+        if (event.type == KEYDOWN and event.key == K_ESCAPE) or event.type == MOUSEBUTTONDOWN:
+            self.game.setGameState(self.back)
+
+    def draw(self, surface):
+        center = surface.get_rect().center
+        titleRect = surface.blit(self.title, self.title.get_rect(midbottom=center))
+        hintRect = surface.blit(self.hint, self.hint.get_rect(midtop=center))
+        return [titleRect, hintRect]
+
+
+class QuitScene(Scene):
+    def enter(self):
+        sys.exit()
+
+
+class LaunchScene(Scene):
+    persistent = True  # the flight carries on when going back to it
+    scalable = True  # the world may be drawn below the window's resolution
+    warpLevels = (1, 5, 10, 50, 100, 1000)  # time warp factors, changed with , and .
+
+    def __init__(self, game, recordPath=None, simulation=None):
+        """
+        recordPath: file to record the rocket's input to for replay.py
+        simulation: "thread" or "process" to step the rocket off the render loop,
+        None to step it in update
+        """
+        super().__init__(game)
+        self.rocket = BaseRocket(
+            pygame.Rect(400 - 25, 400, 50, 90), (255, 255, 255), (400, 400), 1
+        )
+        # every angle of the rocket is rendered while the scene is built, so the
+        # first turns in flight do not rotate the texture on the spot
+        rotationCache.prewarm(self.rocket.texture)
+        self.recorder = InputRecorder(recordPath, self.rocket) if recordPath else None
+        self.simulation = None  # SimulationWorker the rocket is drawn from
+        self.simulationMode = simulation
+        if simulation:
+            self.simulation = SimulationWorker(self.rocket.swarm, mode=simulation)
+            atexit.register(self.simulation.stop)
+        self.simInput = None  # last turn and thrust sent to the simulation
+        self.warp = 0  # index into warpLevels
+        self.trajectory = TrajectoryPredictor(self.rocket.swarm.gravity)
+        self.showTrajectory = False  # toggled with T
+        self.particles = ParticleSystem()
+        self.exhaustRate = 2  # particles per millisecond at full thrust
+
+        # the view follows the rocket through a field of debris
+        self.camera = Camera(game.screen.get_size(), self.rocketCenter())
+        self.camera.follow(self.rocketCenter)
+        self.lodPixels = 3  # debris smaller than this on screen is drawn as a dot
+        self.makeDebris()
+        self.hudFont = textCache.font(FONT, 30)
+
+    def rocketCenter(self):
+        return self.rocket.pos + np.array(self.rocket.rect.size) / 2
+
+    def makeDebris(self, count=20000, spread=20000):
+        centers = np.random.uniform(-spread, spread, (count, 2)) + self.rocketCenter()
+        self.debrisSizes = np.random.uniform(4, 40, (count, 2))
+        self.debris = boxCorners(centers, self.debrisSizes, np.random.rand(count) * 360)
+        self.debrisGrid = LooseGrid()
+        self.debrisGrid.build(self.debris.min(axis=1), self.debris.max(axis=1))
+
+    def update(self, dt):
+        keys = pygame.key.get_pressed()
+        if self.simulation:
+            self.sendInput(keys)  # the worker steps the rocket
+        else:
+            if keys[K_w] or keys[K_a] or keys[K_d]:
+                # thrust is integrated step by step and turning would spin up by
+                # the warp factor, so any steering drops back to real time
+                self.warp = 0
+            dt *= self.warpLevels[self.warp]
+            if self.recorder:
+                self.recorder.record(dt, keys)
+            self.rocket.update(dt, keys)  # update rocket
+        self.camera.update(dt)  # after the rocket, so it follows where the rocket now is
+        self.emitExhaust(dt)
+        self.particles.update(dt)
+
+    def emitExhaust(self, dt):
+        rocket = self.rocket
+        thrust = rocket.swarm.thrust[rocket.index]
+        count = int(self.exhaustRate * dt * thrust / 100)
+        if count <= 0:
+            return
+        # the nozzle is in the middle of the tail, which faces away from the nose
+        width, height = rocket.rect.size
+        theta = np.deg2rad(rocket.rotation)
+        tail = np.array((np.sin(theta), np.cos(theta))) * height / 2
+        nozzle = rocket.pos + (width / 2, height / 2) + tail
+        self.particles.emitExhaust(
+            nozzle[None], np.array([rocket.rotation]), rocket.vel[None], count
+        )
+
+    def sendInput(self, keys):
+        """
+        Passes the rocket's input to the simulation, starting it on first use.
+        """
+        if not self.simulation.started:
+            self.simulation.start()
+        self.rocket.readInput(keys)
+        index = self.rocket.index
+        simInput = (self.rocket.swarm.turn[index], self.rocket.swarm.thrust[index])
+        if simInput != self.simInput and self.simulation.sendInput(index, *simInput):
+            self.simInput = simInput
+
+    def draw(self, surface):
+        if self.simulation:
+            self.simulation.read(self.rocket.swarm)  # latest simulated state
+        camera = self.camera
+        camera.interpolate(self.game.alpha)  # in step with the rocket
+        camera.renderTo(surface)
+        self.drawDebris(surface)
+        if self.showTrajectory:
+            center = (self.rocket.rect.width / 2, self.rocket.rect.height / 2)
+            self.trajectory.draw(surface, self.rocket, offset=center, camera=camera)
+        self.particles.draw(surface, camera)
+        self.rocket.draw(surface, self.game.alpha, camera)
+        # self.rocket.drawDebug(surface)
+        return [surface.get_rect()]  # the view moves with the rocket
+
+    def drawDebris(self, surface):
+        # only debris in view is drawn, as outlines if big enough to make out
+        visible = self.debrisGrid.query(self.camera.viewport())
+        if not len(visible):
+            return
+        big = self.debrisSizes[visible].max(axis=1) * self.camera.scale >= self.lodPixels
+        for polygon in self.camera.worldToScreen(self.debris[visible[big]]):
+            pygame.draw.polygon(surface, (120, 120, 140), polygon.tolist(), 1)
+        centers = self.debris[visible[~big]].mean(axis=1)
+        drawMarkers(surface, self.camera.worldToScreen(centers), (120, 120, 140))
+
+    def drawUi(self, surface):
+        # drawn at the window's resolution, so it stays sharp when the world is not
+        # the simulation worker always steps in real time, so it has no warp
+        text = "Simulation" if self.simulation else f"Warp x{self.warpLevels[self.warp]}"
+        if self.game.resolution is not None:
+            text += f"  Resolution {self.camera.renderScale:.0%}"
+        image = textCache.render(self.hudFont, text, (255, 255, 255))
+        rect = surface.blit(image, (20, surface.get_height() - image.get_height() - 20))
+        return [rect]
+
+    def resize(self, width, height):
+        self.camera.resize((width, height))
+
+    def saveState(self):
+        meta = {
+            "index": self.rocket.index,
+            "time": self.rocket.time,
+            "warp": self.warp,
+            "camera": [*self.camera.pos, self.camera.zoom],
+        }
+        return self.rocket.swarm.state(), meta
+
+    def loadState(self, arrays, meta):
+        self.rocket.swarm.restore(arrays)
+        self.rocket.index = meta["index"]
+        self.rocket.time = meta["time"]
+        self.rocket.orbit = None  # rebuilt from the loaded state on the next coast
+        self.warp = 0 if self.simulation else meta["warp"]
+        *pos, self.camera.zoom = meta["camera"]
+        self.camera.moveTo(pos)
+        self.particles.clear()
+        if self.simulation:
+            self.simulation.stop()  # the worker is stepping the old state
+            self.simulation = SimulationWorker(self.rocket.swarm, mode=self.simulationMode)
+            atexit.register(self.simulation.stop)
+            self.simInput = None
+
+    def isAnimating(self):
+        return True
+
+    def handleEvent(self, event):
+        if event.type == MOUSEWHEEL:
+            self.camera.zoomBy(2 ** (event.y / 4))
+        if event.type != KEYDOWN:
+            return
+        if event.key == K_EQUALS:
+            self.camera.zoomBy(2**0.5)
+        if event.key == K_MINUS:
+            self.camera.zoomBy(2**-0.5)
+        if event.key == K_PERIOD and not self.simulation:
+            self.warp = min(self.warp + 1, len(self.warpLevels) - 1)
+        if event.key == K_COMMA and not self.simulation:
+            self.warp = max(self.warp - 1, 0)
+        if event.key == K_t:
+            self.showTrajectory = not self.showTrajectory
+            self.game.markDirty(self.game.screen.get_rect())
+
+    def unload(self):
+        if self.simulation:
+            self.simulation.stop()
+        if self.recorder:
+            self.recorder.close()
+
+
+class AssemblyScene(Scene):
+    persistent = True  # keep the vessel being built
+    # key -> part added to the bottom of the stack
+    partKeys = {K_p: "pod", K_t: "tank", K_s: "smallTank", K_e: "engine", K_d: "decoupler"}
+    partColors = {
+        "pod": (200, 200, 200),
+        "tank": (230, 230, 230),
+        "smallTank": (230, 230, 230),
+        "engine": (120, 120, 120),
+        "decoupler": (220, 180, 60),
+    }
+
+    def __init__(self, game):
+        """
+        Stacks parts into a vessel from the top down, a decoupler starts a new
+        stage below it. Backspace removes the bottom part, escape goes back.
+        """
+        super().__init__(game)
+        self.vessel = Vessel()
+        self.stage = 0  # stage new parts are added to
+        self.bottom = 0.0  # offset of the bottom of the stack from the root's center
+        self.font = textCache.font(FONT, 30)
+        self.changed = True
+        self.addPart("pod")
+
+    def addPart(self, name):
+        height = PARTS[name][1]
+        # the first part is the root, the rest hang below the stack
+        y = self.bottom + height / 2 if self.vessel.count else 0
+        self.vessel.add(name, (0, y), self.stage)
+        self.bottom = y + height / 2
+        if name == "decoupler":
+            self.stage += 1
+        self.changed = True
+
+    def removePart(self):
+        attached = self.vessel.attached[:self.vessel.count]
+        if attached.sum() <= 1:
+            return  # the pod stays
+        last = attached.nonzero()[0][-1]
+        if PART_NAMES[self.vessel.kind[last]] == "decoupler":
+            self.stage -= 1
+        self.vessel.detach([last])
+        self.bottom -= self.vessel.size[last, 1]
+        self.changed = True
+
+    def enter(self):
+        self.changed = True
+
+    def saveState(self):
+        version = self.vessel.version
+        arrays = {name: (array, version) for name, array in self.vessel.state().items()}
+        return arrays, {"stage": self.stage, "bottom": self.bottom}
+
+    def loadState(self, arrays, meta):
+        self.vessel.restore(arrays)
+        self.stage = meta["stage"]
+        self.bottom = meta["bottom"]
+        self.changed = True
+
+    def handleEvent(self, event):
+        if event.type != KEYDOWN:
+            return
+        if event.key == K_ESCAPE:
+            self.game.setGameState("play")
+        elif event.key == K_BACKSPACE:
+            self.removePart()
+        elif event.key in self.partKeys:
+            self.addPart(self.partKeys[event.key])
+
+    def draw(self, surface):
+        vessel = self.vessel
+        # the stack is centered horizontally with the pod near the top
+        origin = np.array((surface.get_width() / 2, 100))
+        for part in vessel.parts():
+            rect = pygame.Rect((0, 0), part.size)
+            rect.center = origin + part.offset
+            pygame.draw.rect(surface, self.partColors[part.name], rect)
+            pygame.draw.rect(surface, (60, 60, 60), rect, 1)
+
+        mass, center, inertia, thrust = vessel.aggregates()
+        pygame.draw.circle(surface, (255, 60, 60), origin + center, 5)
+        lines = (
+            f"Parts {len(vessel.parts())}  Stages {vessel.currentStage + 1}",
+            f"Mass {mass:.2f}  Thrust {thrust:.0f}",
+            f"Inertia {inertia:.0f}",
+            "P pod  T tank  S small tank  E engine  D decoupler",
+        )
+        for row, line in enumerate(lines):
+            image = textCache.render(self.font, line, (255, 255, 255))
+            surface.blit(image, (20, surface.get_height() - 40 * (len(lines) - row)))
+
+        if not self.changed:
+            return []
+        self.changed = False
+        return [surface.get_rect()]
+
+
+# screens the menus link to that are not built yet, name -> (title, scene to go back to)
+PLACEHOLDERS = {
+    "help": ("Help", "menu"),
+    "options": ("Options", "menu"),
+    "credits": ("Credits", "menu"),
+    "trackingStation": ("Tracking Station", "play"),
+    "contractsMenu": ("Contracts", "play"),
+    "hireCrew": ("Hire Crew", "play"),
+    "techTree": ("Tech Tree", "play"),
+}
+
+
+def registerScenes(scenes, recordPath=None, simulation=None):
+    """
+    Registers every scene of the game with a SceneManager.
+    """
+    scenes.register("loading", LoadingScene)
+    scenes.register("menu", MainMenuScene)
+    scenes.register("play", PlayMenuScene)
+    scenes.register("quit", QuitScene)
+    scenes.register("assembly", AssemblyScene)
+    scenes.register("launch", lambda game: LaunchScene(game, recordPath, simulation))
+    for name, (title, back) in PLACEHOLDERS.items():
+        scenes.register(name, lambda game, title=title, back=back: PlaceholderScene(game, title, back))
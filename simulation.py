@@ -0,0 +1,223 @@
+"""
+Runs a RocketSwarm in its own thread or process so a slow physics step never
+stalls drawing.
+
+The worker and the renderer share one block of memory holding two snapshots of
+the swarm and a ring of inputs. The worker writes each new state into the
+snapshot the renderer is not pointed at and then flips the pointer, and every
+snapshot has a sequence number that is odd while it is being written, so the
+renderer can copy the latest one without taking a lock and retry in the rare
+case the worker lapped it. Inputs travel the other way through a single
+producer, single consumer ring that needs no lock either.
+"""
+import threading
+import multiprocessing
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from rockets import RocketSwarm
+
+LATEST, STOP, COUNT, TICKS = range(4)  # slots of the header
+HEAD, TAIL = range(2)  # slots of the input ring counters
+
+
+class SharedState:
+    def __init__(self, capacity, ringSize=256, name=None, track=True):
+        """
+        Snapshots and input ring in shared memory.
+        capacity: rockets each snapshot can hold
+        ringSize: inputs that can be waiting at once
+        name: name of an existing block to attach to, a new one is made if None
+        track: leave the block registered with this process's resource tracker,
+        False for a spawned process whose own tracker would unlink it on exit
+        """
+        self.capacity = capacity
+        self.ringSize = ringSize
+        layout = (
+            ("header", np.int64, (4,)),
+            ("seq", np.int64, (2,)),
+            ("ring", np.int64, (2,)),
+            ("pos", np.float64, (2, capacity, 2)),
+            ("vel", np.float64, (2, capacity, 2)),
+            ("rotation", np.float64, (2, capacity)),
+            ("angularVelocity", np.float64, (2, capacity)),
+            ("inputs", np.float64, (ringSize, 3)),  # row, turn, thrust
+        )
+        size = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in layout)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        if not track:
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.name = self.shm.name
+
+        offset = 0
+        for field, dtype, shape in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            setattr(self, field, array)
+            offset += array.nbytes
+        if self.owner:
+            self.header[:] = 0
+            self.seq[:] = 0
+            self.ring[:] = 0
+
+    def publish(self, swarm, ticks=0):
+        """
+        Writes the state of swarm into the snapshot not being read and points
+        readers at it.
+        """
+        slot = 1 - self.header[LATEST]
+        n = swarm.count
+        self.seq[slot] += 1  # odd while writing
+        self.pos[slot, :n] = swarm.pos[:n]
+        self.vel[slot, :n] = swarm.vel[:n]
+        self.rotation[slot, :n] = swarm.rotation[:n]
+        self.angularVelocity[slot, :n] = swarm.angularVelocity[:n]
+        self.seq[slot] += 1
+        self.header[COUNT] = n
+        self.header[TICKS] = ticks
+        self.header[LATEST] = slot
+
+    def read(self, swarm, retries=100):
+        """
+        Copies the latest complete snapshot into swarm.
+        return: whether a consistent snapshot was read
+        """
+        for _ in range(retries):
+            slot = self.header[LATEST]
+            seq = self.seq[slot]
+            if seq % 2:
+                continue  # being written, the other slot is about to become latest
+            n = min(int(self.header[COUNT]), swarm.count)
+            swarm.pos[:n] = self.pos[slot, :n]
+            swarm.vel[:n] = self.vel[slot, :n]
+            swarm.rotation[:n] = self.rotation[slot, :n]
+            swarm.angularVelocity[:n] = self.angularVelocity[slot, :n]
+            if self.seq[slot] == seq:
+                # nothing to interpolate between, draw exactly the snapshot
+                swarm.prevPos[:n] = swarm.pos[:n]
+                swarm.prevRotation[:n] = swarm.rotation[:n]
+                return True
+        return False
+
+    def push(self, row, turn, thrust):
+        """
+        Queues an input for the worker, called only by the renderer.
+        return: False if the ring is full
+        """
+        head = self.ring[HEAD]
+        if head - self.ring[TAIL] >= self.ringSize:
+            return False
+        self.inputs[head % self.ringSize] = (row, turn, thrust)
+        self.ring[HEAD] = head + 1  # publish only after the record is written
+        return True
+
+    def pop(self):
+        """
+        Returns every queued input, called only by the worker.
+        """
+        head, tail = self.ring[HEAD], self.ring[TAIL]
+        records = [self.inputs[i % self.ringSize].copy() for i in range(tail, head)]
+        self.ring[TAIL] = head
+        return records
+
+    def close(self):
+        # drop the views before closing, the buffer cannot close while exported
+        for field in ("header", "seq", "ring", "pos", "vel", "rotation",
+                      "angularVelocity", "inputs"):
+            setattr(self, field, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def runSimulation(name, capacity, ringSize, count, speed, gravity, tickRate, track):
+    """
+    Worker loop, steps a swarm at tickRate until told to stop. Top level so it
+    can be the target of a process.
+    """
+    state = SharedState(capacity, ringSize, name, track)
+    swarm = RocketSwarm(capacity)
+    swarm.gravity = gravity
+    for row in range(count):
+        swarm.add((0, 0), speed[row])
+    state.read(swarm)
+
+    stepMs = 1000 / tickRate
+    ticks = 0
+    nextTick = time.perf_counter()
+    while not state.header[STOP]:
+        for row, turn, thrust in state.pop():
+            swarm.turn[int(row)] = turn
+            swarm.thrust[int(row)] = thrust
+        swarm.step(stepMs)
+        ticks += 1
+        state.publish(swarm, ticks)
+
+        nextTick += stepMs / 1000
+        delay = nextTick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            nextTick = time.perf_counter()  # fell behind, do not try to catch up
+    state.close()
+
+
+class SimulationWorker:
+    def __init__(self, swarm, tickRate=120, mode="thread", ringSize=256):
+        """
+        Steps a copy of swarm on its own at tickRate, swarm itself becomes the
+        render copy that read() fills in.
+        mode: "thread" or "process"
+        """
+        self.state = SharedState(swarm.capacity, ringSize)
+        self.state.publish(swarm)
+        self.state.publish(swarm)  # both snapshots hold the starting state
+        args = (
+            self.state.name,
+            swarm.capacity,
+            ringSize,
+            swarm.count,
+            swarm.speed[: swarm.count].copy(),
+            swarm.gravity,
+            tickRate,
+            # forked processes share the owner's resource tracker, spawned ones do not
+            mode == "thread" or multiprocessing.get_start_method() == "fork",
+        )
+        if mode == "thread":
+            self.worker = threading.Thread(target=runSimulation, args=args, daemon=True)
+        elif mode == "process":
+            self.worker = multiprocessing.Process(target=runSimulation, args=args, daemon=True)
+        else:
+            raise ValueError(f"unknown simulation mode {mode!r}")
+        self.started = False
+
+    def start(self):
+        self.worker.start()
+        self.started = True
+
+    def sendInput(self, row, turn, thrust):
+        """
+        Sets the turn and thrust input of a rocket from the next tick on.
+        """
+        return self.state.push(row, turn, thrust)
+
+    def read(self, swarm):
+        """
+        Copies the latest simulated state into swarm for drawing.
+        """
+        return self.state.read(swarm)
+
+    @property
+    def ticks(self):
+        return int(self.state.header[TICKS])
+
+    def stop(self):
+        if self.started:
+            self.state.header[STOP] = 1
+            self.worker.join()
+            self.started = False
+        if self.state.shm is not None:
+            self.state.close()
+            self.state.shm = None
@@ -0,0 +1,111 @@
+import pygame
+import numpy as np
+from orbits import KeplerOrbit
+
+
+class TrajectoryPredictor:
+    def __init__(self, gravity=None, points=2000, horizon=600.0, maxSegments=3):
+        """
+        Predicts where a coasting rocket will go as vertex arrays, one per sphere
+        of influence it passes through, and keeps them until its orbit changes.
+        gravity: GravityModel, None for straight line motion
+        points: vertices per segment
+        horizon: how far ahead to predict open orbits, in simulation time
+        maxSegments: most spheres of influence to follow the path through
+        """
+        self.gravity = gravity
+        self.points = points
+        self.horizon = horizon
+        self.maxSegments = maxSegments
+        self.orbit = None  # orbit the cached segments were predicted from
+        self.start = 0.0  # simulation time the prediction starts at
+        self.closed = False  # the prediction is a whole closed orbit
+        self.segments = []
+        self.lines = None  # vertex lists of the segments last drawn
+        self.linesKey = None  # (id of segments, offset, view) the vertex lists were made from
+
+    def predict(self, rocket):
+        """
+        Returns the predicted path of rocket, recomputed only when its orbit
+        changed or it has flown a quarter of the way through an open prediction.
+        return: list of np.ndarray (n x 2)
+        """
+        orbit = rocket.orbit
+        if orbit is None:
+            # thrusting, so predict the orbit it would follow if the engine stopped now
+            body = self.gravity.dominant(rocket.pos) if self.gravity else None
+            orbit = KeplerOrbit(body, rocket.pos, rocket.vel, rocket.time)
+        elif orbit is self.orbit and (
+            self.closed or rocket.time < self.start + self.horizon / 4
+        ):
+            return self.segments
+
+        self.orbit = orbit
+        self.start = rocket.time
+        self.segments = self.compute(orbit, rocket.time)
+        return self.segments
+
+    def compute(self, orbit, start):
+        """
+        Samples orbit from start, switching to a new orbit when the path leaves
+        the sphere of influence of the current body.
+        """
+        segments = []
+        self.closed = False
+        for _ in range(self.maxSegments):
+            period = getattr(orbit, "period", None)
+            closed = period is not None and period <= self.horizon
+            length = period if closed else self.horizon
+            times = start + np.linspace(0, length, self.points)
+            pos, vel = orbit.statesAt(times)
+            # the path ends at the first time the orbit could not be solved for
+            solved = np.isfinite(pos).all(axis=1)
+            if not solved.all():
+                end = int(np.argmin(solved))
+                times, pos, vel = times[:end], pos[:end], vel[:end]
+                if end < 2:
+                    break
+
+            # first point where another body takes over
+            handover = None
+            if self.gravity is not None:
+                for body in self.gravity.bodies:
+                    offset = pos - body.pos
+                    inside = np.einsum("ij,ij->i", offset, offset) < body.soi * body.soi
+                    if body is orbit.body:
+                        crossing = np.flatnonzero(~inside)
+                    elif orbit.body is None or body.soi < orbit.body.soi:
+                        crossing = np.flatnonzero(inside)
+                    else:
+                        continue
+                    if len(crossing) and (handover is None or crossing[0] < handover):
+                        handover = crossing[0]
+
+            if handover is None or handover == 0:
+                segments.append(pos)
+                self.closed = closed and not segments[:-1]
+                break
+            segments.append(pos[: handover + 1])
+            body = self.gravity.dominant(pos[handover])
+            orbit = KeplerOrbit(body, pos[handover], vel[handover], times[handover])
+            start = times[handover]
+        return segments
+
+    def draw(self, surface, rocket, color=(80, 160, 255), offset=(0, 0), camera=None):
+        """
+        Draws the predicted path of rocket as one polyline per segment.
+        offset: added to every vertex, e.g. to draw from the rocket's center
+        camera: Camera to draw through, None to draw world positions as they are
+        """
+        segments = self.predict(rocket)
+        offset = tuple(offset)
+        view = (tuple(camera.center), camera.scale) if camera else None
+        key = (id(segments), offset, view)
+        if self.linesKey != key:
+            transform = camera.worldToScreen if camera else np.asarray
+            self.lines = [
+                transform(segment + offset).tolist() for segment in segments if len(segment) > 1
+            ]
+            self.linesKey = key
+        for line in self.lines:
+            pygame.draw.lines(surface, color, False, line)
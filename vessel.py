@@ -0,0 +1,269 @@
+import numpy as np
+
+# part name -> (width, height, dry mass, fuel mass, thrust, fuel burnt per simulation unit at full thrust)
+PARTS = {
+    "pod": (30, 30, 1.0, 0.0, 0.0, 0.0),
+    "tank": (30, 60, 0.5, 4.0, 0.0, 0.0),
+    "smallTank": (30, 30, 0.25, 2.0, 0.0, 0.0),
+    "engine": (30, 30, 1.5, 0.0, 200.0, 0.5),
+    "decoupler": (30, 10, 0.1, 0.0, 0.0, 0.0),
+}
+PART_NAMES = list(PARTS)
+
+
+class Part:
+    __slots__ = ("vessel", "index")
+
+    def __init__(self, vessel, index):
+        """
+        A view onto one row of a Vessel, holds no state of its own.
+        """
+        self.vessel = vessel
+        self.index = index
+
+    @property
+    def name(self):
+        return PART_NAMES[self.vessel.kind[self.index]]
+
+    @property
+    def offset(self):
+        return self.vessel.offset[self.index]
+
+    @property
+    def size(self):
+        return self.vessel.size[self.index]
+
+    @property
+    def stage(self):
+        return int(self.vessel.stage[self.index])
+
+    @property
+    def mass(self):
+        return self.vessel.dryMass[self.index] + self.vessel.fuel[self.index]
+
+    @property
+    def fuel(self):
+        return self.vessel.fuel[self.index]
+
+    @property
+    def thrust(self):
+        return self.vessel.thrust[self.index]
+
+    @property
+    def attached(self):
+        return bool(self.vessel.attached[self.index])
+
+
+class Vessel:
+    # per part arrays, one row each
+    fields = ("kind", "offset", "size", "dryMass", "fuel", "thrust", "burnRate",
+              "stage", "attached")
+
+    def __init__(self, capacity=64, stages=16):
+        """
+        A craft made of parts stored in contiguous arrays, each row is one part.
+        Mass, center of mass, moment of inertia and thrust are kept as running
+        sums per stage, updated only by the parts that change, so reading them
+        costs the same however many parts the vessel has.
+        capacity: number of part rows allocated up front, grows when full
+        stages: number of stages allocated up front, grows when needed
+        """
+        self.count = 0
+        self.capacity = 0
+        self.kind = np.zeros(0, dtype=np.int16)  # index into PART_NAMES
+        self.offset = np.zeros((0, 2), dtype=np.float64)  # center relative to the root part
+        self.size = np.zeros((0, 2), dtype=np.float64)
+        self.dryMass = np.zeros(0, dtype=np.float64)
+        self.fuel = np.zeros(0, dtype=np.float64)
+        self.thrust = np.zeros(0, dtype=np.float64)
+        self.burnRate = np.zeros(0, dtype=np.float64)
+        self.stage = np.zeros(0, dtype=np.int16)  # stage the part is dropped with
+        self.attached = np.zeros(0, dtype=bool)
+        self.grow(capacity)
+
+        # running sums of attached parts, one row per stage
+        self.stageMass = np.zeros(stages)
+        self.stageMoment = np.zeros((stages, 2))  # sum of mass times offset
+        self.stageInertia = np.zeros(stages)  # about the root part
+        self.stageThrust = np.zeros(stages)  # of the engines, whether fueled or not
+        self.stageFuel = np.zeros(stages)
+        self.currentStage = -1  # highest stage still attached, it fires next
+        self.totals = None  # cached (mass, center of mass, inertia, thrust)
+        self.version = 0  # changes whenever a part does, for Autosaver
+
+    def grow(self, capacity):
+        """
+        Reallocates every part array with room for capacity rows.
+        """
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def growStages(self, stages):
+        for name in ("stageMass", "stageMoment", "stageInertia", "stageThrust", "stageFuel"):
+            old = getattr(self, name)
+            new = np.zeros((stages,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, name, offset, stage):
+        """
+        Attaches a part from PARTS centered at offset from the root.
+        stage: stage the part is dropped with, higher stages are dropped first
+        return: Part
+        """
+        width, height, dryMass, fuel, thrust, burnRate = PARTS[name]
+        if self.count == self.capacity:
+            self.grow(max(16, self.capacity * 2))
+        if stage >= len(self.stageMass):
+            self.growStages(max(stage + 1, len(self.stageMass) * 2))
+        index = self.count
+        self.kind[index] = PART_NAMES.index(name)
+        self.offset[index] = offset
+        self.size[index] = (width, height)
+        self.dryMass[index] = dryMass
+        self.fuel[index] = fuel
+        self.thrust[index] = thrust
+        self.burnRate[index] = burnRate
+        self.stage[index] = stage
+        self.attached[index] = True
+        self.count += 1
+        self.currentStage = max(self.currentStage, stage)
+        self.accumulate(slice(index, index + 1), 1)
+        return Part(self, index)
+
+    def state(self):
+        """
+        Returns the part arrays for saving, see restore.
+        """
+        return {name: getattr(self, name)[:self.count] for name in self.fields}
+
+    def restore(self, arrays):
+        """
+        Replaces every part with the arrays state returned.
+        """
+        count = len(arrays["kind"])
+        self.count = 0
+        self.grow(max(16, count))
+        for name in self.fields:
+            getattr(self, name)[:count] = arrays[name]
+        self.count = count
+        attached = self.stage[:count][self.attached[:count]]
+        self.currentStage = int(attached.max()) if len(attached) else -1
+        if self.currentStage >= len(self.stageMass):
+            self.growStages(self.currentStage + 1)
+        self.resum()
+
+    def parts(self):
+        return [Part(self, index) for index in np.flatnonzero(self.attached[:self.count])]
+
+    def accumulate(self, rows, sign, fuel=None):
+        """
+        Adds or with sign -1 removes the contribution of rows to the stage sums.
+        fuel: only account for this much fuel of each row, e.g. the fuel burnt
+        """
+        stage = self.stage[rows]
+        offset = self.offset[rows]
+        size = self.size[rows]
+        if fuel is None:
+            mass = self.dryMass[rows] + self.fuel[rows]
+            np.add.at(self.stageFuel, stage, sign * self.fuel[rows])
+            np.add.at(self.stageThrust, stage, sign * self.thrust[rows])
+        else:
+            mass = fuel
+            np.add.at(self.stageFuel, stage, sign * fuel)
+        # each part is a solid rect, moved to the root with the parallel axis theorem
+        inertia = mass * (np.einsum("ij,ij->i", size, size) / 12 + np.einsum("ij,ij->i", offset, offset))
+        np.add.at(self.stageMass, stage, sign * mass)
+        np.add.at(self.stageMoment, stage, sign * mass[:, None] * offset)
+        np.add.at(self.stageInertia, stage, sign * inertia)
+        self.totals = None
+        self.version += 1
+
+    def separate(self):
+        """
+        Drops every part of the current stage.
+        return: indices of the dropped parts
+        """
+        if self.currentStage < 0:
+            return np.zeros(0, dtype=np.intp)
+        dropped = np.flatnonzero(self.attached[:self.count] & (self.stage[:self.count] == self.currentStage))
+        self.detach(dropped)
+        return dropped
+
+    def detach(self, rows):
+        """
+        Removes parts, e.g. ones that broke off.
+        rows: indices of parts, repeats and ones already detached are ignored
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.intp))  # each part removed once
+        rows = rows[self.attached[rows]]
+        self.accumulate(rows, -1)
+        self.attached[rows] = False
+        # the next stage to fire is the highest one with parts left
+        attached = self.stage[:self.count][self.attached[:self.count]]
+        self.currentStage = int(attached.max()) if len(attached) else -1
+
+    def burn(self, dt, throttle=1.0):
+        """
+        Burns fuel of the current stage for dt simulation units at throttle,
+        drawn evenly from the stage's tanks.
+        return: fuel burnt
+        """
+        stage = self.currentStage
+        if stage < 0 or not self.stageThrust[stage] or self.stageFuel[stage] <= 0:
+            return 0.0
+        rows = np.flatnonzero(self.attached[:self.count] & (self.stage[:self.count] == stage))
+        demand = self.burnRate[rows].sum() * throttle * dt
+        tanks = rows[self.fuel[rows] > 0]
+        supply = self.fuel[tanks].sum()
+        burnt = min(demand, supply)
+        if burnt <= 0:
+            return 0.0
+        used = self.fuel[tanks] * (burnt / supply)
+
+        # only the tanks' mass changes, so only their contribution is updated
+        self.accumulate(tanks, -1, used)
+        self.fuel[tanks] -= used
+        if burnt == supply:
+            # out of fuel, clear the rounding left in the sums so the engines stop
+            self.fuel[tanks] = 0
+            self.stageFuel[stage] = 0
+        return burnt
+
+    def resum(self):
+        """
+        Recomputes the stage sums from every part, clearing the rounding error
+        running sums collect over a long flight.
+        """
+        for name in ("stageMass", "stageMoment", "stageInertia", "stageThrust", "stageFuel"):
+            getattr(self, name)[:] = 0
+        self.accumulate(np.flatnonzero(self.attached[:self.count]), 1)
+
+    def aggregates(self):
+        """
+        Returns the mass, center of mass, moment of inertia about the center of
+        mass and available thrust of the attached vessel, cached until it changes.
+        """
+        if self.totals is None:
+            mass = self.stageMass.sum()
+            center = self.stageMoment.sum(axis=0) / mass if mass > 0 else np.zeros(2)
+            # parallel axis theorem again, from the root to the center of mass
+            inertia = self.stageInertia.sum() - mass * (center @ center)
+            stage = self.currentStage
+            thrust = self.stageThrust[stage] if stage >= 0 and self.stageFuel[stage] > 0 else 0.0
+            self.totals = (mass, center, inertia, thrust)
+        return self.totals
+
+    def stageAggregates(self, stage):
+        """
+        Returns the mass, center of mass, moment of inertia about that center and
+        thrust of the parts dropped with stage, whether fueled or not.
+        """
+        mass = self.stageMass[stage]
+        center = self.stageMoment[stage] / mass if mass > 0 else np.zeros(2)
+        inertia = self.stageInertia[stage] - mass * (center @ center)
+        return mass, center, inertia, self.stageThrust[stage]